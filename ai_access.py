@@ -8,43 +8,112 @@ AI 调用云端 IDE 的完整示例
 import os
 import time
 import json
+import threading
 import subprocess
-from typing import Optional
+from typing import Callable, Optional
 
 # ============================================
 # 方式一：Playwright 浏览器自动化（推荐）
 # ============================================
 
-def access_gitpod_via_playwright():
+GITPOD_URL = 'https://gitpod.io/#https://github.com/EtAorangE/ai-cloud-ide'
+
+# IDE 页面元素（VS Code Web），用于判断各阶段是否就绪
+IDE_READY_SELECTOR = '.monaco-workbench'
+TERMINAL_INPUT_SELECTOR = '.xterm-helper-textarea'
+EDITOR_SELECTOR = '.monaco-editor.focused'
+QUICK_INPUT_SELECTOR = '.quick-input-widget input'
+
+# 终端输出从 xterm 的 DOM 渲染器读取。VS Code 默认可能使用 WebGL/Canvas 渲染，
+# 画布上的文字读不到，所以仓库的 .vscode/settings.json 把
+# terminal.integrated.gpuAcceleration 设为 off，强制使用 DOM 渲染器。
+# DOM 渲染器只渲染可见的行，超出终端高度的早期输出读不到。
+TERMINAL_OUTPUT_SELECTOR = '.xterm-rows'
+
+# 页面地址包含这些关键字时视为跳转到了登录/授权页
+LOGIN_URL_KEYWORDS = ('login', 'authorize')
+
+# 等待网络空闲的上限（秒），页面有长连接时不会真正空闲
+NETWORK_IDLE_TIMEOUT = 15
+
+
+def wait_for_ide_ready(page, timeout: float = 180, selector: str = IDE_READY_SELECTOR,
+                       network_idle: bool = False):
+    """
+    等待 IDE 页面就绪：以工作台元素出现为准
+    
+    network_idle 为 True 时，工作台出现后再等网络空闲，最多 NETWORK_IDLE_TIMEOUT 秒，
+    等不到也不报错（Gitpod 页面可能保持长连接）；
+    只有工作台在 timeout 内未出现时才抛出 Playwright TimeoutError
+    """
+    from playwright.sync_api import TimeoutError as PlaywrightTimeout
+    
+    page.wait_for_selector(selector, state='visible', timeout=timeout * 1000)
+    
+    if network_idle:
+        try:
+            page.wait_for_load_state('networkidle', timeout=NETWORK_IDLE_TIMEOUT * 1000)
+        except PlaywrightTimeout:
+            pass
+
+
+def wait_for_login_or_ide(page, timeout: float = 180, selector: str = IDE_READY_SELECTOR) -> str:
+    """
+    等待页面跳转到登录页或工作台出现，以先发生的为准
+    
+    登录跳转可能由前端脚本在 domcontentloaded 之后才触发，所以不能只在打开页面后检查一次地址。
+    返回 'login' 或 'ready'，超时抛出 Playwright TimeoutError
+    """
+    from playwright.sync_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeout
+    
+    deadline = time.monotonic() + timeout
+    while True:
+        if any(keyword in page.url for keyword in LOGIN_URL_KEYWORDS):
+            return 'login'
+        try:
+            element = page.query_selector(selector)
+            if element and element.is_visible():
+                return 'ready'
+        except PlaywrightError:
+            # 页面正在跳转，执行上下文已销毁，下一轮再查
+            pass
+        if time.monotonic() >= deadline:
+            raise PlaywrightTimeout(f'{timeout}s 内既未跳转到登录页，工作台也未出现')
+        page.wait_for_timeout(250)
+
+
+def access_gitpod_via_playwright(url: str = GITPOD_URL, ready_timeout: float = 180, headless: bool = True):
     """
     使用 Playwright 浏览器自动化访问 Gitpod
     需要安装：pip install playwright && playwright install chromium
+    
+    Args:
+        url: 工作区地址（也可以是本地的替身页面，便于测试）
+        ready_timeout: 等待工作区就绪的超时时间（秒）
+        headless: 无头模式，适合 AI 运行
     """
     try:
         from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
         
         with sync_playwright() as p:
             # 启动浏览器
-            browser = p.chromium.launch(headless=True)  # headless=True 适合 AI 运行
+            browser = p.chromium.launch(headless=headless)
             context = browser.new_context()
             page = context.new_page()
             
             # 访问 Gitpod
             print("🚀 正在打开 Gitpod...")
-            page.goto('https://gitpod.io/#https://github.com/EtAorangE/ai-cloud-ide')
-            
-            # 等待页面加载
-            time.sleep(5)
+            page.goto(url, wait_until='domcontentloaded')
             
-            # 检查是否需要登录
-            if 'login' in page.url or 'authorize' in page.url:
-                print("⚠️ 需要登录 GitHub，请手动完成登录...")
-                # AI 可以在这里等待用户登录，或者使用预存的 cookies
-                page.wait_for_url('**/gitpod.io/workspaces*', timeout=120000)
-            
-            # 等待工作区启动
+            # 等待工作区启动，期间跳转到登录页则先等用户登录
             print("⏳ 等待工作区启动...")
-            time.sleep(30)  # Gitpod 启动需要时间
+            try:
+                if wait_for_login_or_ide(page, ready_timeout) == 'login':
+                    print("⚠️ 需要登录 GitHub，请手动完成登录...")
+                    # AI 可以在这里等待用户登录，或者使用预存的 cookies；登录后会跳回工作区
+                    wait_for_ide_ready(page, 120 + ready_timeout)
+            except PlaywrightTimeout:
+                return {'status': 'error', 'message': f'工作区在 {ready_timeout}s 内未就绪'}
             
             # 获取工作区 URL
             workspace_url = page.url
@@ -68,6 +137,78 @@ def access_gitpod_via_playwright():
         return {'status': 'error', 'message': str(e)}
 
 
+class BrowserContextPool:
+    """
+    预热的浏览器上下文池
+    需要安装：pip install playwright && playwright install chromium
+    
+    整个池只启动一个 Chromium，CloudIDEAgent 通过 acquire/release 复用上下文，
+    省去每次连接都启动浏览器，且归还时保留 cookie，登录状态可以复用。
+    Playwright 同步 API 不是线程安全的，池和取出的上下文只能在创建池的线程中使用。
+    """
+    
+    def __init__(self, size: int = 2, headless: bool = True, storage_state: Optional[str] = None, **launch_options):
+        """
+        Args:
+            size: 预热并保留的空闲上下文数量
+            headless: 无头模式
+            storage_state: 预存的登录状态文件（context.storage_state() 导出）
+            launch_options: 传给 chromium.launch 的其他参数
+        """
+        from playwright.sync_api import sync_playwright
+        
+        self.size = size
+        self.storage_state = storage_state
+        self._playwright = sync_playwright().start()
+        self.browser = self._playwright.chromium.launch(headless=headless, **launch_options)
+        self._idle = [self._new_context() for _ in range(size)]
+        self._in_use = set()
+    
+    def _new_context(self):
+        return self.browser.new_context(storage_state=self.storage_state)
+    
+    def acquire(self):
+        """取出一个上下文，没有空闲时新建"""
+        context = self._idle.pop() if self._idle else self._new_context()
+        self._in_use.add(context)
+        return context
+    
+    def release(self, context, reset: bool = False):
+        """
+        归还上下文：关闭其中的页面，reset 为真时同时清除 cookie
+        
+        空闲数量已达 size 时直接关闭该上下文
+        """
+        self._in_use.discard(context)
+        for page in list(context.pages):
+            page.close()
+        if reset:
+            context.clear_cookies()
+        
+        if len(self._idle) < self.size:
+            self._idle.append(context)
+        else:
+            context.close()
+    
+    def stats(self) -> dict:
+        return {'idle': len(self._idle), 'in_use': len(self._in_use)}
+    
+    def close(self):
+        """关闭所有上下文和浏览器"""
+        for context in self._idle + list(self._in_use):
+            context.close()
+        self._idle = []
+        self._in_use = set()
+        self.browser.close()
+        self._playwright.stop()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
 # ============================================
 # 方式二：Gitpod API（需要 API Token）
 # ============================================
@@ -117,38 +258,289 @@ def access_gitpod_via_api(api_token: str):
 # 方式三：SSH 访问（需要配置）
 # ============================================
 
-def access_via_ssh(host: str, username: str, key_path: str, command: str):
+class _PooledTransport:
+    """连接池中的一条已认证 SSH 连接"""
+    
+    def __init__(self, client):
+        self.client = client
+        self.transport = client.get_transport()
+        self.active = 0
+        self.last_used = time.monotonic()
+    
+    def is_alive(self) -> bool:
+        return self.transport is not None and self.transport.is_active()
+    
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class SSHExecutor:
     """
-    通过 SSH 访问云端 IDE 终端
+    可复用的 SSH 命令执行器
     需要：pip install paramiko
+    
+    - 按主机维护已认证连接池，省去每条命令的密钥交换与认证
+    - 同一连接上用多个 channel 并发执行命令
+    - 并发读取 stdout/stderr，可通过回调实时获取输出，避免大输出时死锁
+    - 连接开启 keepalive，空闲超时后自动回收
     """
-    try:
+    
+    def __init__(self, username: str, key_path: Optional[str] = None, password: Optional[str] = None,
+                 port: int = 22, max_connections_per_host: int = 2, max_channels_per_connection: int = 8,
+                 keepalive: int = 30, idle_timeout: float = 300, connect_timeout: float = 10,
+                 host_key_policy=None):
+        """
+        Args:
+            username: 登录用户名
+            key_path: 私钥路径
+            password: 密码（与 key_path 二选一）
+            port: 默认 SSH 端口，可在 host 中用 host:port 覆盖
+            max_connections_per_host: 每个主机最多保持的连接数
+            max_channels_per_connection: 每条连接上同时打开的 channel 数（需不超过 sshd 的 MaxSessions）
+            keepalive: keepalive 间隔（秒），0 表示关闭
+            idle_timeout: 连接空闲多久后回收（秒）
+            connect_timeout: 建立连接的超时时间（秒）
+            host_key_policy: paramiko 主机密钥策略，默认 AutoAddPolicy
+        """
         import paramiko
         
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self._paramiko = paramiko
+        self.username = username
+        self.key_path = key_path
+        self.password = password
+        self.port = port
+        self.max_connections_per_host = max_connections_per_host
+        self.max_channels_per_connection = max_channels_per_connection
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.host_key_policy = host_key_policy or paramiko.AutoAddPolicy()
+        
+        self._pools = {}
+        self._connecting = {}
+        self._cond = threading.Condition()
+        self._closed = False
         
-        # 连接
+        self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+        self._reaper.start()
+    
+    def _parse_host(self, host: str):
+        name, _, port = host.partition(':')
+        return name, int(port) if port else self.port
+    
+    def _connect(self, hostname: str, port: int) -> _PooledTransport:
+        """建立一条新的已认证连接"""
+        client = self._paramiko.SSHClient()
+        client.set_missing_host_key_policy(self.host_key_policy)
         client.connect(
-            hostname=host,
-            username=username,
-            key_filename=key_path
+            hostname=hostname,
+            port=port,
+            username=self.username,
+            key_filename=self.key_path,
+            password=self.password,
+            timeout=self.connect_timeout,
+            banner_timeout=self.connect_timeout,
+            auth_timeout=self.connect_timeout
         )
+        if self.keepalive:
+            client.get_transport().set_keepalive(self.keepalive)
+        return _PooledTransport(client)
+    
+    def _acquire(self, host: str) -> _PooledTransport:
+        """取得一条有空闲 channel 的连接，必要时新建，全部占满时等待"""
+        hostname, port = self._parse_host(host)
+        key = (hostname, port)
+        
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError('SSHExecutor 已关闭')
+                
+                pool = self._pools.setdefault(key, [])
+                for conn in [c for c in pool if not c.is_alive()]:
+                    pool.remove(conn)
+                    conn.close()
+                
+                candidates = [c for c in pool if c.active < self.max_channels_per_connection]
+                if candidates:
+                    conn = min(candidates, key=lambda c: c.active)
+                    conn.active += 1
+                    return conn
+                
+                if len(pool) + self._connecting.get(key, 0) < self.max_connections_per_host:
+                    self._connecting[key] = self._connecting.get(key, 0) + 1
+                    break
+                
+                self._cond.wait()
+        
+        # 在锁外完成握手和认证，不阻塞其他主机的请求
+        try:
+            conn = self._connect(hostname, port)
+        finally:
+            with self._cond:
+                self._connecting[key] -= 1
+                self._cond.notify_all()
+        
+        with self._cond:
+            if not self._closed:
+                conn.active += 1
+                self._pools.setdefault(key, []).append(conn)
+                return conn
+        
+        # 建立连接期间执行器已被关闭，新连接不能再放入连接池
+        conn.close()
+        raise RuntimeError('SSHExecutor 已关闭')
+    
+    def _release(self, conn: _PooledTransport):
+        with self._cond:
+            conn.active -= 1
+            conn.last_used = time.monotonic()
+            self._cond.notify_all()
+    
+    def _reap_loop(self):
+        """后台回收空闲和已断开的连接"""
+        interval = max(1.0, min(self.idle_timeout / 2, 30))
+        while True:
+            with self._cond:
+                self._cond.wait(interval)
+                if self._closed:
+                    return
+                now = time.monotonic()
+                for pool in self._pools.values():
+                    for conn in list(pool):
+                        idle = conn.active == 0 and now - conn.last_used > self.idle_timeout
+                        if idle or not conn.is_alive():
+                            pool.remove(conn)
+                            conn.close()
+    
+    def execute(self, host: str, command: str, timeout: Optional[float] = None,
+                on_output: Optional[Callable[[str, str], None]] = None) -> dict:
+        """
+        在远程主机上执行命令
         
-        # 执行命令
-        stdin, stdout, stderr = client.exec_command(command)
+        Args:
+            host: 主机名，可带端口（host:port）
+            command: 要执行的命令
+            timeout: 命令超时时间（秒），超时后关闭 channel
+            on_output: 输出回调 on_output(stream, text)，stream 为 stdout 或 stderr
+        """
+        conn = self._acquire(host)
+        try:
+            channel = conn.transport.open_session(timeout=self.connect_timeout)
+        except Exception:
+            self._release(conn)
+            raise
+        
+        try:
+            channel.exec_command(command)
+            return self._collect(channel, timeout, on_output)
+        finally:
+            channel.close()
+            self._release(conn)
+    
+    def _collect(self, channel, timeout, on_output) -> dict:
+        """同时读取 stdout 与 stderr，直到命令结束"""
+        import codecs
+        import select
+        
+        deadline = time.monotonic() + timeout if timeout else None
+        streams = {
+            'stdout': (channel.recv_ready, channel.recv, codecs.getincrementaldecoder('utf-8')(errors='replace'), []),
+            'stderr': (channel.recv_stderr_ready, channel.recv_stderr, codecs.getincrementaldecoder('utf-8')(errors='replace'), [])
+        }
+        
+        def drain(name):
+            ready, recv, decoder, chunks = streams[name]
+            if not ready():
+                return False
+            # 每次只取一块，两个流交替读取，任一方都不会被饿死
+            text = decoder.decode(recv(32768))
+            if text:
+                chunks.append(text)
+                if on_output:
+                    on_output(name, text)
+            return True
         
-        output = stdout.read().decode()
-        error = stderr.read().decode()
+        while True:
+            # 每轮都检查超时，持续输出的命令也会在 timeout 后中止
+            if deadline and time.monotonic() > deadline:
+                raise TimeoutError(f'Command timed out after {timeout}s')
+            received = drain('stdout') | drain('stderr')
+            if received:
+                continue
+            # 服务端可能先发退出码再发最后的输出，必须等到 EOF 且缓冲区读空才算结束
+            eof = channel.eof_received or channel.closed
+            if eof and channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+            # channel 有数据或状态变化时 fileno 可读，超时兜底轮询
+            select.select([channel], [], [], 0.05)
         
-        client.close()
+        for name, (_, _, decoder, chunks) in streams.items():
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                chunks.append(tail)
+                if on_output:
+                    on_output(name, tail)
         
         return {
             'status': 'success',
-            'output': output,
-            'error': error,
+            'output': ''.join(streams['stdout'][3]),
+            'error': ''.join(streams['stderr'][3]),
+            'exit_status': channel.recv_exit_status(),
             'method': 'ssh'
         }
+    
+    def stats(self) -> dict:
+        """各主机的连接数与正在执行的命令数"""
+        with self._cond:
+            return {
+                f'{hostname}:{port}': {
+                    'connections': len(pool),
+                    'active_channels': sum(c.active for c in pool)
+                }
+                for (hostname, port), pool in self._pools.items()
+            }
+    
+    def close(self):
+        """关闭所有连接"""
+        with self._cond:
+            self._closed = True
+            pools, self._pools = self._pools, {}
+            self._cond.notify_all()
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+# access_via_ssh 共用的执行器，按 (用户名, 私钥) 区分
+_ssh_executors = {}
+_ssh_executors_lock = threading.Lock()
+
+
+def access_via_ssh(host: str, username: str, key_path: str, command: str):
+    """
+    通过 SSH 访问云端 IDE 终端
+    需要：pip install paramiko
+    
+    连接会被缓存复用，连续调用无需重复握手；需要并发或流式输出时直接使用 SSHExecutor
+    """
+    try:
+        with _ssh_executors_lock:
+            executor = _ssh_executors.get((username, key_path))
+            if executor is None:
+                executor = SSHExecutor(username, key_path=key_path)
+                _ssh_executors[(username, key_path)] = executor
+        
+        return executor.execute(host, command)
         
     except ImportError:
         return {'status': 'error', 'message': '请安装 paramiko: pip install paramiko'}
@@ -220,11 +612,25 @@ class CloudIDEAgent:
     封装了所有访问方式
     """
     
-    def __init__(self, method: str = 'playwright', **kwargs):
+    def __init__(self, method: str = 'playwright', pool: Optional[BrowserContextPool] = None,
+                 url: str = GITPOD_URL, ready_timeout: float = 180, command_timeout: float = 60, **kwargs):
+        """
+        Args:
+            method: 访问方式，playwright 或 api
+            pool: 浏览器上下文池，多个代理共用时可省去重复启动浏览器
+            url: 工作区地址（也可以是本地的替身页面，便于测试）
+            ready_timeout: 等待工作区就绪的超时时间（秒）
+            command_timeout: 等待命令输出的默认超时时间（秒）
+        """
         self.method = method
+        self.pool = pool
+        self.url = url
+        self.ready_timeout = ready_timeout
+        self.command_timeout = command_timeout
         self.config = kwargs
         self.workspace_url = None
         self.browser = None
+        self.context = None
         self.page = None
         
     def connect(self) -> dict:
@@ -237,19 +643,28 @@ class CloudIDEAgent:
             return {'status': 'error', 'message': f'不支持的方法: {self.method}'}
     
     def _connect_playwright(self) -> dict:
-        """使用 Playwright 连接"""
+        """使用 Playwright 连接，返回时工作区已就绪"""
         try:
-            from playwright.sync_api import sync_playwright
+            from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
             
-            self.playwright = sync_playwright().start()
-            self.browser = self.playwright.chromium.launch(headless=True)
-            self.context = self.browser.new_context()
+            if self.pool:
+                self.context = self.pool.acquire()
+            else:
+                self.playwright = sync_playwright().start()
+                self.browser = self.playwright.chromium.launch(headless=True)
+                self.context = self.browser.new_context()
             self.page = self.context.new_page()
             
-            # 访问 Gitpod
-            self.page.goto('https://gitpod.io/#https://github.com/EtAorangE/ai-cloud-ide')
+            # 访问 Gitpod 并等待 IDE 就绪
+            self.page.goto(self.url, wait_until='domcontentloaded')
+            try:
+                if wait_for_login_or_ide(self.page, self.ready_timeout) == 'login':
+                    return {'status': 'error', 'message': '需要登录，请在上下文池中使用已登录的 storage_state'}
+            except PlaywrightTimeout:
+                return {'status': 'error', 'message': f'工作区在 {self.ready_timeout}s 内未就绪'}
             
-            return {'status': 'success', 'message': '正在启动工作区...'}
+            self.workspace_url = self.page.url
+            return {'status': 'success', 'message': '工作区已就绪', 'workspace_url': self.workspace_url}
             
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
@@ -262,50 +677,112 @@ class CloudIDEAgent:
         
         return access_gitpod_via_api(api_token)
     
-    def run_command(self, command: str) -> dict:
-        """在终端执行命令"""
+    def _focus_terminal(self, timeout: float):
+        """确保终端已打开并获得焦点（已聚焦时不再按快捷键，避免把终端切换关闭）"""
+        focused = "sel => !!document.activeElement && document.activeElement.matches(sel)"
+        if not self.page.evaluate(focused, TERMINAL_INPUT_SELECTOR):
+            self.page.keyboard.press('Control+`')
+        self.page.wait_for_function(focused, arg=TERMINAL_INPUT_SELECTOR, timeout=timeout * 1000)
+    
+    def run_command(self, command: str, timeout: Optional[float] = None) -> dict:
+        """
+        在终端执行命令，等到命令输出完成后返回
+        
+        命令前后各用 printf 输出开始标记和带退出码的结束标记，终端中出现结束标记即视为完成，
+        两个标记之间即为命令输出。标记都很短且从行首开始，不会像输入的命令行那样被终端折行拆开。
+        输出从终端可见的行中读取，超过终端宽度的输出行会按屏幕折行拆开；
+        开始标记已滚出屏幕时只能拿到后面一部分，此时结果中 truncated 为 True
+        """
         if not self.page:
             return {'status': 'error', 'message': '未连接到工作区'}
         
+        import re
+        from playwright.sync_api import TimeoutError as PlaywrightTimeout
+        
+        timeout = timeout or self.command_timeout
+        token = os.urandom(4).hex()
+        # 输入行里是 %s 占位符，只有命令真正执行时终端里才会出现完整标记；
+        # 结束标记前先换行，命令输出末尾没有换行时标记也从行首开始
+        typed = (f"printf '__AI_START_%s__\\n' {token}; {command}; "
+                 f"printf '\\n__AI_DONE_%s_%s__\\n' {token} $?")
+        start_marker = f'__AI_START_{token}__'
+        marker = f'__AI_DONE_{token}_(\\d+)__'
+        
         try:
             # 打开终端
-            self.page.keyboard.press('Control+`')
-            time.sleep(1)
+            self._focus_terminal(timeout)
             
             # 输入命令
-            self.page.keyboard.type(command)
+            self.page.keyboard.type(typed)
             self.page.keyboard.press('Enter')
             
-            return {'status': 'success', 'message': f'命令已执行: {command}'}
+            # 等待结束标记出现（需要 DOM 渲染器，见 TERMINAL_OUTPUT_SELECTOR）
+            if not self.page.query_selector(TERMINAL_OUTPUT_SELECTOR):
+                return {'status': 'error',
+                        'message': '终端未使用 DOM 渲染器，请把 terminal.integrated.gpuAcceleration 设为 off'}
+            self.page.wait_for_function(
+                "([sel, pattern]) => {"
+                "  const el = document.querySelector(sel);"
+                "  return !!el && new RegExp(pattern).test(el.innerText);"
+                "}",
+                arg=[TERMINAL_OUTPUT_SELECTOR, marker],
+                timeout=timeout * 1000
+            )
             
+            # xterm 的 DOM 渲染用不换行空格表示空格
+            text = self.page.inner_text(TERMINAL_OUTPUT_SELECTOR).replace('\xa0', ' ')
+            match = list(re.finditer(marker, text))[-1]
+            start = text.rfind(start_marker, 0, match.start())
+            output = text[start + len(start_marker):match.start()] if start != -1 else text[:match.start()]
+            
+            return {
+                'status': 'success',
+                'message': f'命令已执行: {command}',
+                'output': output.strip('\n'),
+                'exit_code': int(match.group(1)),
+                'truncated': start == -1
+            }
+            
+        except PlaywrightTimeout:
+            return {'status': 'error', 'message': f'等待命令输出超时（{timeout}s）: {command}'}
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
     
-    def create_file(self, filename: str, content: str) -> dict:
+    def create_file(self, filename: str, content: str, timeout: float = 10) -> dict:
         """创建文件"""
         if not self.page:
             return {'status': 'error', 'message': '未连接到工作区'}
         
+        from playwright.sync_api import TimeoutError as PlaywrightTimeout
+        
         try:
-            # 使用快捷键创建新文件
+            # 使用快捷键创建新文件，等待编辑器获得焦点
             self.page.keyboard.press('Control+N')
-            time.sleep(0.5)
+            self.page.wait_for_selector(EDITOR_SELECTOR, state='visible', timeout=timeout * 1000)
             
-            # 保存文件
+            # 保存文件，等待文件名输入框出现
             self.page.keyboard.press('Control+S')
-            time.sleep(0.5)
+            self.page.wait_for_selector(QUICK_INPUT_SELECTOR, state='visible', timeout=timeout * 1000)
             
-            # 输入文件名
+            # 输入文件名，等待输入框关闭即保存完成
             self.page.keyboard.type(filename)
             self.page.keyboard.press('Enter')
+            self.page.wait_for_selector(QUICK_INPUT_SELECTOR, state='hidden', timeout=timeout * 1000)
             
             return {'status': 'success', 'message': f'文件已创建: {filename}'}
             
+        except PlaywrightTimeout:
+            return {'status': 'error', 'message': f'创建文件超时（{timeout}s）: {filename}'}
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
     
     def disconnect(self):
-        """断开连接"""
+        """断开连接（使用上下文池时把上下文归还给池）"""
+        if self.pool and self.context:
+            self.pool.release(self.context)
+            self.context = None
+            self.page = None
+            return
         if self.browser:
             self.browser.close()
         if hasattr(self, 'playwright'):
@@ -336,7 +813,6 @@ if __name__ == '__main__':
     
     # 执行命令
     if connect_result['status'] == 'success':
-        time.sleep(30)  # 等待工作区启动
         cmd_result = agent.run_command('python main.py')
         print(f"命令执行: {cmd_result}")
     
@@ -10,68 +10,489 @@ AI 调用云端 IDE 的简单客户端
 3. 运行此脚本
 """
 
-import requests
+import os
+import ssl
+import sys
 import json
-from typing import Optional
+import base64
+import socket
+import struct
+import hashlib
+import itertools
+import threading
+import traceback
+import time
+import requests
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+
+# ============================================
+# Unix 域套接字传输（同主机访问 api_server.py）
+# ============================================
+
+class _UnixHTTPConnection(HTTPConnection):
+    """通过 Unix 域套接字建立的 HTTP 连接"""
+    
+    def __init__(self, socket_path: str, **kwargs):
+        super().__init__('localhost', **kwargs)
+        self.socket_path = socket_path
+    
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise NewConnectionError(self, f'无法连接 Unix 套接字 {self.socket_path}: {e}') from e
+        return sock
+
+
+class _UnixHTTPConnectionPool(HTTPConnectionPool):
+    """复用 Unix 套接字连接的连接池"""
+    
+    def __init__(self, socket_path: str, maxsize: int = 10):
+        super().__init__('localhost', maxsize=maxsize)
+        self.socket_path = socket_path
+    
+    def _new_conn(self):
+        return _UnixHTTPConnection(self.socket_path, timeout=self.timeout.connect_timeout)
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """requests 适配器：把 http+unix:// 请求转发到指定的 Unix 套接字"""
+    
+    def __init__(self, socket_path: str, pool_maxsize: int = 10):
+        super().__init__()
+        self.pool = _UnixHTTPConnectionPool(socket_path, maxsize=pool_maxsize)
+    
+    def get_connection(self, url, proxies=None):
+        return self.pool
+    
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self.pool
+    
+    def close(self):
+        self.pool.close()
+        super().close()
+
+
+# ============================================
+# WebSocket 多路复用传输（对应 api_server.py 的 /api/ws）
+# ============================================
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_WS_OP_CONTINUATION = 0x0
+_WS_OP_TEXT = 0x1
+_WS_OP_BINARY = 0x2
+_WS_OP_CLOSE = 0x8
+_WS_OP_PING = 0x9
+_WS_OP_PONG = 0xA
+
+
+def _ws_apply_mask(payload: bytes, mask: bytes) -> bytes:
+    """按 RFC 6455 对负载做掩码运算"""
+    n = len(payload)
+    if not n:
+        return payload
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(n, 'big')
+
+
+class WebSocketTransport:
+    """
+    WebSocket 多路复用传输
+    
+    一条连接上并发执行多个操作，响应按请求 id 匹配，可乱序返回；
+    流式命令输出和文件变更事件通过回调推送。
+    """
+    
+    def __init__(self, url: str, timeout: float = 30, headers: Optional[dict] = None):
+        """
+        建立连接
+        
+        Args:
+            url: ws:// 或 wss:// 地址，路径为空时默认 /api/ws
+            timeout: 建立连接和握手的超时时间（秒）
+            headers: 握手请求附加的请求头（如 X-API-Key）
+        """
+        parsed = urlparse(url)
+        secure = parsed.scheme == 'wss'
+        host = parsed.hostname
+        port = parsed.port or (443 if secure else 80)
+        path = parsed.path if parsed.path not in ('', '/') else '/api/ws'
+        
+        sock = socket.create_connection((host, port), timeout=timeout)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        self._sock = sock
+        self._rfile = sock.makefile('rb')
+        self._handshake(host, port, path, headers or {})
+        sock.settimeout(None)
+        
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._listeners = {}
+        self._subscriptions = set()
+        self.closed = False
+        
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+    
+    def _handshake(self, host: str, port: int, path: str, headers: dict):
+        """发送升级请求并校验 101 响应"""
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {host}:{port}\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\n'
+            'Sec-WebSocket-Version: 13\r\n'
+            + ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+            + '\r\n'
+        )
+        self._sock.sendall(request.encode('ascii'))
+        
+        status_line = self._rfile.readline().decode('latin-1')
+        headers = {}
+        while True:
+            line = self._rfile.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        
+        expected = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode('ascii')).digest()).decode('ascii')
+        if ' 101 ' not in status_line or headers.get('sec-websocket-accept') != expected:
+            self._sock.close()
+            raise ConnectionError(f'WebSocket 握手失败: {status_line.strip()}')
+    
+    def _send_frame(self, opcode: int, payload: bytes):
+        """发送一帧（客户端帧必须加掩码）"""
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+        with self._send_lock:
+            self._sock.sendall(header + mask + _ws_apply_mask(payload, mask))
+    
+    def _read_exact(self, n: int) -> bytes:
+        data = self._rfile.read(n)
+        if len(data) < n:
+            raise ConnectionError('WebSocket 连接已关闭')
+        return data
+    
+    def _read_frame(self):
+        """读取一帧，返回 (fin, opcode, payload)"""
+        b1, b2 = self._read_exact(2)
+        length = b2 & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self._read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self._read_exact(8))[0]
+        mask = self._read_exact(4) if b2 & 0x80 else None
+        payload = self._read_exact(length) if length else b''
+        if mask:
+            payload = _ws_apply_mask(payload, mask)
+        return bool(b1 & 0x80), b1 & 0x0F, payload
+    
+    def _read_loop(self):
+        """后台读线程：按 id 分发响应和事件"""
+        fragments = []
+        message_opcode = None
+        try:
+            while True:
+                fin, opcode, payload = self._read_frame()
+                if opcode == _WS_OP_CLOSE:
+                    break
+                if opcode == _WS_OP_PING:
+                    self._send_frame(_WS_OP_PONG, payload)
+                    continue
+                if opcode == _WS_OP_PONG:
+                    continue
+                if opcode != _WS_OP_CONTINUATION:
+                    message_opcode = opcode
+                    fragments = []
+                fragments.append(payload)
+                if fin:
+                    self._handle_message(message_opcode, b''.join(fragments))
+                    fragments = []
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._fail_pending(ConnectionError('WebSocket 连接已关闭'))
+    
+    def _handle_message(self, opcode: int, payload: bytes):
+        """处理一条完整消息"""
+        if opcode == _WS_OP_BINARY:
+            size = struct.unpack('!I', payload[:4])[0]
+            message = json.loads(payload[4:4 + size].decode('utf-8'))
+            message['result']['content'] = payload[4 + size:]
+        else:
+            message = json.loads(payload.decode('utf-8'))
+        
+        req_id = message.get('id')
+        if 'event' in message:
+            listener = self._listeners.get(req_id)
+            if listener:
+                try:
+                    listener(message['event'], message.get('data'))
+                except Exception:
+                    # 回调出错不能影响读线程，否则整条连接上的请求都会失败
+                    print(f"⚠️ WebSocket 事件回调出错 (id={req_id}, event={message['event']}):", file=sys.stderr)
+                    traceback.print_exc()
+            return
+        
+        with self._lock:
+            future = self._pending.pop(req_id, None)
+            if req_id not in self._subscriptions:
+                self._listeners.pop(req_id, None)
+        if future:
+            future.set_result(message.get('result'))
+    
+    def _fail_pending(self, error: Exception):
+        """连接断开时让所有未完成的请求失败"""
+        with self._lock:
+            self.closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+    
+    def call_async(self, op: str, params: Optional[dict] = None, blob: Optional[bytes] = None,
+                   on_event: Optional[Callable[[str, object], None]] = None) -> Future:
+        """
+        发起一个操作，立即返回 Future
+        
+        Args:
+            op: 操作名，如 execute、read_file、write_file
+            params: 操作参数，与 HTTP 接口的请求体相同
+            blob: 不为 None 时以二进制帧发送（用于写入文件内容）
+            on_event: 推送事件回调 on_event(event, data)
+        """
+        return self._send_request(op, params, blob, on_event)[1]
+    
+    def _send_request(self, op, params, blob, on_event):
+        """登记并发送请求，返回 (请求 id, Future)"""
+        req_id = next(self._ids)
+        future = Future()
+        message = {'id': req_id, 'op': op, 'params': params or {}}
+        
+        with self._lock:
+            if self.closed:
+                raise ConnectionError('WebSocket 连接已关闭')
+            self._pending[req_id] = future
+            if on_event:
+                self._listeners[req_id] = on_event
+            if op == 'subscribe':
+                self._subscriptions.add(req_id)
+        
+        try:
+            if blob is None:
+                self._send_frame(_WS_OP_TEXT, json.dumps(message, ensure_ascii=False).encode('utf-8'))
+            else:
+                header = json.dumps(message, ensure_ascii=False).encode('utf-8')
+                self._send_frame(_WS_OP_BINARY, struct.pack('!I', len(header)) + header + blob)
+        except BaseException:
+            self._forget(req_id)
+            raise
+        return req_id, future
+    
+    def _forget(self, req_id):
+        """放弃一个请求：之后到达的结果和事件都被丢弃"""
+        with self._lock:
+            self._pending.pop(req_id, None)
+            self._listeners.pop(req_id, None)
+            self._subscriptions.discard(req_id)
+    
+    def call(self, op: str, params: Optional[dict] = None, blob: Optional[bytes] = None,
+             on_event: Optional[Callable[[str, object], None]] = None,
+             timeout: Optional[float] = None) -> dict:
+        """发起一个操作并等待结果，超时后不再接收该请求的结果和事件"""
+        req_id, future = self._send_request(op, params, blob, on_event)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            self._forget(req_id)
+            raise
+    
+    def close(self):
+        """发送关闭帧并断开连接"""
+        try:
+            self._send_frame(_WS_OP_CLOSE, struct.pack('!H', 1000))
+        except OSError:
+            pass
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._reader.join(timeout=1)
+
 
 class CloudIDEClient:
     """云端 IDE 客户端"""
     
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, api_key: Optional[str] = None, timeout=(5, 60)):
         """
         初始化客户端
         
         Args:
-            base_url: Gitpod 转发的 API 地址，如 https://8080-xxx.gitpod.io
+            base_url: Gitpod 转发的 API 地址，如 https://8080-xxx.gitpod.io；
+                      同一主机上也可使用 Unix 套接字，如 unix:///tmp/ide-api.sock；
+                      使用 ws:// 或 wss:// 地址时通过单条 WebSocket 连接多路复用所有调用
+            api_key: 可选的 API Key，服务端据此做限流和公平调度（否则按来源地址）
+            timeout: (连接超时, 读取超时)，单位秒，也可以是一个数同时用于两者；
+                     执行命令时读取超时会自动放宽到命令超时之后
         """
-        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.ws = None
+        self.timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        headers = {'X-API-Key': api_key} if api_key else {}
+        self.session.headers.update(headers)
+        
+        if base_url.startswith('unix://'):
+            socket_path = base_url[len('unix://'):]
+            self.session.mount('http+unix://', UnixSocketAdapter(socket_path))
+            self.base_url = 'http+unix://localhost'
+        elif base_url.startswith(('ws://', 'wss://')):
+            self.ws = WebSocketTransport(base_url, timeout=self.timeout[0], headers=headers)
+            self.base_url = base_url.rstrip('/')
+        else:
+            self.base_url = base_url.rstrip('/')
+    
+    def close(self):
+        """关闭底层连接"""
+        if self.ws:
+            self.ws.close()
+        self.session.close()
+    
+    def _timeout_for(self, read_timeout: Optional[float] = None) -> tuple:
+        """返回 (连接超时, 读取超时)，传入 read_timeout 时覆盖默认的读取超时，连接超时也不超过它"""
+        connect, read = self.timeout
+        if read_timeout is None:
+            return connect, read
+        return (read_timeout if connect is None else min(connect, read_timeout)), read_timeout
+    
+    def _command_timeout(self, timeout: float) -> tuple:
+        """执行命令时读取超时至少要比命令超时多留出余量"""
+        read = self.timeout[1]
+        return self._timeout_for(None if read is None else max(read, timeout + 5))
     
-    def get_status(self) -> dict:
-        """获取 IDE 状态"""
-        response = requests.get(f'{self.base_url}/api/status')
+    def _call(self, op: str, params: Optional[dict], method: str, path: str,
+              timeout: Optional[tuple] = None) -> dict:
+        """通过当前传输调用一个操作，timeout 为 (连接超时, 读取超时)，默认取构造时的设置"""
+        timeout = timeout or self.timeout
+        if self.ws:
+            return self.ws.call(op, params, timeout=timeout[1])
+        if method == 'GET':
+            response = self.session.get(f'{self.base_url}{path}', timeout=timeout)
+        else:
+            response = self.session.post(f'{self.base_url}{path}', json=params, timeout=timeout)
         return response.json()
     
+    def get_status(self, timeout: Optional[float] = None) -> dict:
+        """获取 IDE 状态，timeout 为本次调用的读取超时（秒），默认取构造时的设置"""
+        return self._call('status', None, 'GET', '/api/status', self._timeout_for(timeout))
+    
     def list_files(self) -> dict:
         """列出文件"""
-        response = requests.get(f'{self.base_url}/api/files')
-        return response.json()
+        return self._call('list_files', None, 'GET', '/api/files')
     
     def read_file(self, filename: str) -> dict:
         """读取文件"""
-        response = requests.get(f'{self.base_url}/api/file/{filename}')
-        return response.json()
+        return self._call('read_file', {'filename': filename}, 'GET', f'/api/file/{filename}')
+    
+    def read_file_bytes(self, filename: str) -> dict:
+        """读取文件原始内容（WebSocket 下以二进制帧传输，content 为 bytes）"""
+        if self.ws:
+            return self.ws.call('read_file', {'filename': filename, 'binary': True}, timeout=self.timeout[1])
+        result = self.read_file(filename)
+        if 'content' in result:
+            result['content'] = result['content'].encode('utf-8')
+        return result
     
     def write_file(self, filename: str, content: str) -> dict:
         """写入文件"""
-        response = requests.post(
-            f'{self.base_url}/api/file',
-            json={'filename': filename, 'content': content}
-        )
-        return response.json()
+        return self._call('write_file', {'filename': filename, 'content': content}, 'POST', '/api/file')
+    
+    def write_file_bytes(self, filename: str, content: bytes) -> dict:
+        """写入文件原始内容（WebSocket 下以二进制帧传输）"""
+        if self.ws:
+            return self.ws.call('write_file', {'filename': filename}, blob=content, timeout=self.timeout[1])
+        return self.write_file(filename, content.decode('utf-8'))
     
     def delete_file(self, filename: str) -> dict:
         """删除文件"""
-        response = requests.post(
-            f'{self.base_url}/api/delete',
-            json={'filename': filename}
-        )
-        return response.json()
+        return self._call('delete_file', {'filename': filename}, 'POST', '/api/delete')
     
     def create_directory(self, dirname: str) -> dict:
         """创建目录"""
-        response = requests.post(
-            f'{self.base_url}/api/mkdir',
-            json={'dirname': dirname}
-        )
-        return response.json()
+        return self._call('mkdir', {'dirname': dirname}, 'POST', '/api/mkdir')
     
     def execute(self, command: str, timeout: int = 30) -> dict:
         """执行命令"""
-        response = requests.post(
-            f'{self.base_url}/api/execute',
-            json={'command': command, 'timeout': timeout}
-        )
-        return response.json()
+        params = {'command': command, 'timeout': timeout}
+        return self._call('execute', params, 'POST', '/api/execute', self._command_timeout(timeout))
+    
+    def execute_stream(self, command: str, on_output: Callable[[str, str], None], timeout: int = 30) -> dict:
+        """
+        执行命令并实时接收输出
+        
+        Args:
+            on_output: 输出回调 on_output(stream, text)，stream 为 stdout 或 stderr
+        
+        WebSocket 下输出边产生边推送；HTTP 下命令结束后一次性回调
+        """
+        params = {'command': command, 'timeout': timeout, 'stream': True}
+        if self.ws:
+            return self.ws.call('execute', params, on_event=on_output, timeout=self._command_timeout(timeout)[1])
+        
+        result = self.execute(command, timeout)
+        for stream in ('stdout', 'stderr'):
+            if result.get(stream):
+                on_output(stream, result[stream])
+        return result
+    
+    def subscribe_file_events(self, callback: Callable[[str, dict], None]) -> dict:
+        """订阅文件变更事件，callback(event, data) 中 data 含 action 与 path（仅 WebSocket）"""
+        if not self.ws:
+            raise RuntimeError('文件事件推送需要 WebSocket 连接（ws:// 或 wss://）')
+        return self.ws.call('subscribe', on_event=callback, timeout=self.timeout[1])
+    
+    def snapshot(self, path: str = '', label: Optional[str] = None, exclude: Optional[list] = None) -> dict:
+        """创建工作区（或子目录）快照，返回 snapshot_id"""
+        params = {'path': path, 'label': label, 'exclude': exclude or []}
+        return self._call('snapshot', params, 'POST', '/api/snapshot')
+    
+    def restore(self, snapshot_id: str, dry_run: bool = False) -> dict:
+        """恢复快照，只重写有变化的文件"""
+        params = {'snapshot_id': snapshot_id, 'dry_run': dry_run}
+        return self._call('restore', params, 'POST', '/api/restore')
+    
+    def list_snapshots(self) -> dict:
+        """列出快照"""
+        return self._call('list_snapshots', None, 'GET', '/api/snapshots')
+    
+    def delete_snapshot(self, snapshot_id: str) -> dict:
+        """删除快照"""
+        return self._call('delete_snapshot', {'snapshot_id': snapshot_id}, 'POST', '/api/snapshot/delete')
     
     def run_python(self, code: str) -> dict:
         """运行 Python 代码"""
@@ -81,6 +502,291 @@ class CloudIDEClient:
         return self.execute('python _temp.py')
 
 
+# ============================================
+# 多工作区连接池（把任务分摊到多个 api_server 实例）
+# ============================================
+
+# 服务端准入控制拒绝请求时返回的原因，请求未被执行，可以安全地换一个实例重试
+_REJECTION_REASONS = {'rate_limited', 'client_queue_full', 'queue_full', 'queue_timeout'}
+
+
+class _Endpoint:
+    """池中的一个 api_server 实例及其健康状态"""
+    
+    def __init__(self, url: str, client: CloudIDEClient):
+        # 保存传入的原始地址：多个 unix:// 实例的 client.base_url 都是 http+unix://localhost
+        self.url = url
+        self.client = client
+        self.healthy = True
+        self.in_flight = 0
+        self.server_load = 0
+        self.latency = 0.0
+        self.failures = 0
+    
+    @property
+    def load(self) -> float:
+        return self.in_flight + self.server_load
+
+
+class CloudIDEPool:
+    """
+    多工作区客户端
+    
+    - 后台定期通过 /api/status 检查各实例健康状况和服务端队列负载
+    - 命令发往负载最低的健康实例；传入 affinity 时按最高随机权重哈希固定到同一实例，
+      用于依赖文件状态的工作（实例下线时只有落在它上面的 affinity 会迁移）
+    - 只读请求（读文件、列目录）在慢实例上超过 hedge_after 秒未返回时向下一个实例发起对冲请求，
+      取先返回的结果；失败或被服务端限流时换实例重试
+    - map_execute 把一批命令并发分摊到各实例并按原顺序合并结果
+    """
+    
+    def __init__(self, endpoints: list, api_key: Optional[str] = None, health_interval: float = 5,
+                 hedge_after: float = 0.5, max_workers: int = 32, timeout=(5, 60), health_timeout: float = 2):
+        """
+        Args:
+            endpoints: 各实例地址，支持 CloudIDEClient 接受的所有地址形式
+            api_key: 可选的 API Key
+            health_interval: 健康检查间隔（秒）
+            hedge_after: 只读请求发起对冲前的等待时间（秒）
+            max_workers: 并发请求线程数
+            timeout: 各实例客户端的 (连接超时, 读取超时)，见 CloudIDEClient
+            health_timeout: 健康检查的超时时间（秒），超时的实例标记为不健康
+        """
+        if not endpoints:
+            raise ValueError('至少需要一个实例地址')
+        
+        self.health_timeout = health_timeout
+        self.endpoints = [
+            _Endpoint(url, CloudIDEClient(url, api_key=api_key, timeout=timeout)) for url in endpoints
+        ]
+        self.health_interval = health_interval
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # 健康检查使用单独的小线程池，不会被卡住的业务请求占满
+        self._health_executor = ThreadPoolExecutor(max_workers=min(len(endpoints), 8))
+        self._stop = threading.Event()
+        
+        self.check_health()
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+    
+    # ---------- 健康检查 ----------
+    
+    def _check_endpoint(self, endpoint: _Endpoint):
+        started = time.monotonic()
+        try:
+            status = endpoint.client.get_status(timeout=self.health_timeout)
+            admission = status.get('admission', {})
+            healthy = status.get('status') == 'running'
+        except Exception:
+            healthy, admission = False, {}
+        
+        with self._lock:
+            endpoint.healthy = healthy
+            if healthy:
+                endpoint.server_load = admission.get('in_flight', 0) + admission.get('queue_depth', 0)
+                endpoint.failures = 0
+                self._record_latency(endpoint, time.monotonic() - started)
+    
+    def check_health(self):
+        """立即检查所有实例"""
+        list(self._health_executor.map(self._check_endpoint, self.endpoints))
+    
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            try:
+                self.check_health()
+            except RuntimeError:
+                # close() 之后线程池已关闭
+                return
+    
+    @staticmethod
+    def _record_latency(endpoint: _Endpoint, elapsed: float):
+        endpoint.latency = elapsed if not endpoint.latency else endpoint.latency * 0.8 + elapsed * 0.2
+    
+    # ---------- 实例选择 ----------
+    
+    def _healthy(self) -> list:
+        healthy = [e for e in self.endpoints if e.healthy]
+        if not healthy:
+            raise ConnectionError('没有可用的健康实例')
+        return healthy
+    
+    def _ranked(self, affinity: Optional[str] = None) -> list:
+        """按优先级排列健康实例：有 affinity 时按哈希权重，否则按负载和延迟"""
+        with self._lock:
+            healthy = self._healthy()
+            if affinity is not None:
+                def weight(e):
+                    return hashlib.sha256(f'{affinity}|{e.url}'.encode('utf-8')).digest()
+                return sorted(healthy, key=weight, reverse=True)
+            return sorted(healthy, key=lambda e: (e.load, e.latency))
+    
+    def _invoke(self, endpoint: _Endpoint, method: str, *args, **kwargs) -> dict:
+        """在指定实例上调用 CloudIDEClient 方法，并维护负载、延迟和健康状态"""
+        with self._lock:
+            endpoint.in_flight += 1
+        started = time.monotonic()
+        try:
+            result = getattr(endpoint.client, method)(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                endpoint.failures += 1
+                if endpoint.failures >= 2:
+                    endpoint.healthy = False
+            raise
+        finally:
+            with self._lock:
+                endpoint.in_flight -= 1
+        
+        with self._lock:
+            endpoint.failures = 0
+            self._record_latency(endpoint, time.monotonic() - started)
+        if isinstance(result, dict):
+            result['endpoint'] = endpoint.url
+        return result
+    
+    @staticmethod
+    def _not_sent(error: Exception) -> bool:
+        """连接阶段就失败的请求肯定没有被服务端执行"""
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(error, requests.exceptions.ConnectTimeout) or isinstance(reason, NewConnectionError)
+    
+    @staticmethod
+    def _rejected(result) -> bool:
+        return isinstance(result, dict) and result.get('reason') in _REJECTION_REASONS
+    
+    def _call(self, method: str, *args, affinity: Optional[str] = None, **kwargs) -> dict:
+        """
+        按优先级选择实例调用；被服务端限流或连接失败时换下一个实例
+        
+        有 affinity 时只在实例不健康或连接失败时迁移：限流是暂时的，
+        换到没有相关文件状态的实例上执行反而出错，此时直接返回拒绝结果（含 retry_after）
+        """
+        result, error = None, None
+        for endpoint in self._ranked(affinity):
+            try:
+                result = self._invoke(endpoint, method, *args, **kwargs)
+            except Exception as e:
+                if not self._not_sent(e):
+                    raise
+                error = e
+                continue
+            if affinity is not None or not self._rejected(result):
+                return result
+        
+        if result is not None:
+            return result
+        raise error
+    
+    def _hedged(self, method: str, *args, **kwargs) -> dict:
+        """
+        对冲的只读请求
+        
+        先发往最优实例，hedge_after 秒内未返回（或失败、被限流）时再发往下一个实例，取最先成功的结果
+        """
+        candidates = self._ranked()
+        pending = set()
+        last_result, last_error = None, None
+        
+        while candidates or pending:
+            if candidates:
+                pending.add(self._executor.submit(self._invoke, candidates.pop(0), method, *args, **kwargs))
+            
+            done, pending = wait(pending, timeout=self.hedge_after if candidates else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if not self._rejected(result):
+                    return result
+                last_result = result
+        
+        if last_result is not None:
+            return last_result
+        raise last_error
+    
+    # ---------- 对外接口 ----------
+    
+    def execute(self, command: str, timeout: int = 30, affinity: Optional[str] = None) -> dict:
+        """
+        在负载最低（或 affinity 对应）的实例上执行命令，结果中 endpoint 为所用实例
+        
+        affinity 对应的实例限流时不换实例，返回服务端的拒绝结果（reason、retry_after），由调用方稍后重试
+        """
+        return self._call('execute', command, timeout, affinity=affinity)
+    
+    def map_execute(self, commands: list, timeout: int = 30) -> list:
+        """并发执行一批命令，分摊到各实例，按输入顺序返回结果"""
+        def run(command):
+            try:
+                return self.execute(command, timeout)
+            except Exception as e:
+                return {'error': str(e), 'command': command}
+        
+        return list(self._executor.map(run, commands))
+    
+    def read_file(self, filename: str, affinity: Optional[str] = None) -> dict:
+        """读取文件；无 affinity 时视为各实例内容一致，使用对冲请求"""
+        if affinity is not None:
+            return self._call('read_file', filename, affinity=affinity)
+        return self._hedged('read_file', filename)
+    
+    def write_file(self, filename: str, content: str, affinity: Optional[str] = None) -> dict:
+        """写入文件（有状态的工作请传入 affinity，保证后续请求落在同一实例）"""
+        return self._call('write_file', filename, content, affinity=affinity)
+    
+    def list_files(self, affinity: Optional[str] = None) -> dict:
+        """列出文件（对冲请求）"""
+        if affinity is not None:
+            return self._call('list_files', affinity=affinity)
+        return self._hedged('list_files')
+    
+    def broadcast(self, method: str, *args, **kwargs) -> dict:
+        """在所有健康实例上调用同一方法（如同步配置文件），返回 {实例地址: 结果}"""
+        endpoints = self._ranked()
+        futures = {e.url: self._executor.submit(self._invoke, e, method, *args, **kwargs) for e in endpoints}
+        results = {}
+        for url, future in futures.items():
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                results[url] = {'error': str(e)}
+        return results
+    
+    def stats(self) -> list:
+        """各实例的健康状态、负载和延迟"""
+        with self._lock:
+            return [
+                {
+                    'endpoint': e.url,
+                    'healthy': e.healthy,
+                    'in_flight': e.in_flight,
+                    'server_load': e.server_load,
+                    'latency': round(e.latency, 4)
+                }
+                for e in self.endpoints
+            ]
+    
+    def close(self):
+        """停止健康检查并关闭所有连接"""
+        self._stop.set()
+        self._health_executor.shutdown(wait=False)
+        self._executor.shutdown(wait=False)
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
 # ============================================
 # 使用示例
 # ============================================
@@ -10,27 +10,1033 @@
 
 import os
 import json
+import stat
+import base64
+import codecs
+import hashlib
+import heapq
+import math
+import signal
+import socket
+import socketserver
+import struct
 import subprocess
+import sys
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import traceback
 
+from snapshot_store import SnapshotStore
+
 # 工作目录
 WORKSPACE = os.path.expanduser('~/workspace')
 
+# 快照存储目录（位于工作区之外，避免快照自身被纳入快照）
+SNAPSHOT_DIR = os.path.expanduser('~/.ide-snapshots')
+
+
+# ============================================
+# 文件变更事件
+# ============================================
+
+class FileEventHub:
+    """
+    文件变更事件分发
+    
+    通过 API 写入、删除文件或创建目录时发布事件，WebSocket 订阅者会收到推送。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._next_token = 0
+    
+    def subscribe(self, callback):
+        """注册回调，返回用于取消订阅的 token"""
+        with self._lock:
+            self._next_token += 1
+            self._subscribers[self._next_token] = callback
+            return self._next_token
+    
+    def unsubscribe(self, token):
+        """取消订阅"""
+        with self._lock:
+            self._subscribers.pop(token, None)
+    
+    def publish(self, action, name):
+        """发布事件"""
+        event = {'action': action, 'path': name}
+        with self._lock:
+            callbacks = list(self._subscribers.values())
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception:
+                pass
+
+
+FILE_EVENTS = FileEventHub()
+
+
+# ============================================
+# 文件内容缓存
+# ============================================
+
+# 缓存总大小上限，以及可缓存的单个文件大小上限（更大的文件直接读盘）
+FILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+FILE_CACHE_MAX_FILE_SIZE = 4 * 1024 * 1024
+
+
+class FileCacheEntry:
+    """缓存条目：原始内容、解码后的文本及预编码的 HTTP 响应体"""
+    
+    def __init__(self, signature, data, filename):
+        self.signature = signature
+        self.data = data
+        self.text = None
+        self.decode_error = None
+        self.body = None
+        self.body_filename = None
+        
+        try:
+            # 与文本模式 open() 一致：统一换行符为 \n
+            self.text = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        except UnicodeDecodeError as e:
+            self.decode_error = str(e)
+        else:
+            self.body = self._encode(filename)
+            self.body_filename = filename
+    
+    @property
+    def size(self):
+        """条目实际占用的内存：原始内容、解码文本和响应体都计入"""
+        return (len(self.data) + (sys.getsizeof(self.text) if self.text is not None else 0)
+                + (len(self.body) if self.body else 0))
+    
+    def _encode(self, filename):
+        return json.dumps({'filename': filename, 'content': self.text}, ensure_ascii=False).encode('utf-8')
+    
+    def json_body(self, filename):
+        """返回读取该文件的 JSON 响应体，文件名与预编码时一致则直接复用"""
+        if filename == self.body_filename:
+            return self.body
+        return self._encode(filename)
+
+
+class FileCache:
+    """
+    按容量淘汰的 LRU 文件内容缓存
+    
+    条目以 (mtime, size, inode) 校验，通过 API 写入或删除时主动失效；
+    同一文件的并发未命中只读盘一次，其余请求等待并共享结果
+    （只共享按相同签名发起的加载，写入前开始的加载不会把旧内容交给写入后的请求）。
+    """
+    
+    def __init__(self, max_bytes=FILE_CACHE_MAX_BYTES, max_file_size=FILE_CACHE_MAX_FILE_SIZE):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._shared = 0
+        self._evictions = 0
+    
+    @staticmethod
+    def _signature(st):
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    
+    def get(self, filepath, filename):
+        """获取文件的缓存条目，必要时从磁盘加载"""
+        signature = self._signature(os.stat(filepath))
+        owner = False
+        
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(filepath)
+                self._hits += 1
+                return entry
+            
+            loading = self._loading.get(filepath)
+            if loading is not None and loading[0] == signature:
+                loader = loading[1]
+                self._shared += 1
+            else:
+                loader = Future()
+                self._loading[filepath] = (signature, loader)
+                self._misses += 1
+                owner = True
+        
+        if not owner:
+            return loader.result()
+        
+        try:
+            entry = self._load(filepath, filename)
+            loader.set_result(entry)
+            return entry
+        except BaseException as e:
+            loader.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                # 期间可能已被更新签名的加载替换或被 invalidate 移除，只移除自己的
+                loading = self._loading.get(filepath)
+                if loading is not None and loading[1] is loader:
+                    del self._loading[filepath]
+    
+    def _load(self, filepath, filename):
+        """读盘并在文件未被并发修改时写入缓存"""
+        with open(filepath, 'rb') as f:
+            before = self._signature(os.fstat(f.fileno()))
+            data = f.read()
+        entry = FileCacheEntry(before, data, filename)
+        
+        try:
+            # 读取期间文件被修改则不缓存
+            cacheable = len(entry.data) <= self.max_file_size and self._signature(os.stat(filepath)) == before
+        except OSError:
+            cacheable = False
+        
+        with self._lock:
+            old = self._entries.pop(filepath, None)
+            if old is not None:
+                self._bytes -= old.size
+            if not cacheable:
+                return entry
+            self._entries[filepath] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._evictions += 1
+        return entry
+    
+    def invalidate(self, filepath):
+        """使文件（或目录下所有文件）的缓存失效，进行中的加载也不再共享给后续请求"""
+        prefix = filepath.rstrip(os.sep) + os.sep
+        with self._lock:
+            for path in [p for p in self._entries if p == filepath or p.startswith(prefix)]:
+                self._bytes -= self._entries.pop(path).size
+            for path in [p for p in self._loading if p == filepath or p.startswith(prefix)]:
+                del self._loading[path]
+    
+    def stats(self):
+        """缓存命中率与内存占用"""
+        with self._lock:
+            lookups = self._hits + self._misses + self._shared
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'shared_loads': self._shared,
+                'evictions': self._evictions,
+                'hit_rate': round((self._hits + self._shared) / lookups, 4) if lookups else 0.0
+            }
+
+
+FILE_CACHE = FileCache()
+
+SNAPSHOTS = SnapshotStore(WORKSPACE, SNAPSHOT_DIR)
+
+
+# ============================================
+# 准入控制与按客户端公平调度
+# ============================================
+
+# 每个客户端（API Key 或来源地址）的令牌桶：每秒补充的请求数和桶容量
+ADMISSION_RATE = 20
+ADMISSION_BURST = 40
+
+# 耗时操作（执行命令、读写文件、快照）的全局并发上限与单客户端并发上限
+ADMISSION_MAX_CONCURRENT = 8
+ADMISSION_PER_CLIENT_CONCURRENCY = 4
+
+# 排队上限与最长排队时间（秒），超出后立即拒绝，而不是让队列无限增长
+ADMISSION_MAX_QUEUE = 64
+ADMISSION_PER_CLIENT_QUEUE = 16
+ADMISSION_QUEUE_TIMEOUT = 10
+
+# API Key -> 调度权重（默认 1），权重越高分得的执行份额越大
+ADMISSION_WEIGHTS = {}
+
+# 需要排队调度的耗时操作（WebSocket 操作名）
+EXPENSIVE_OPS = {'execute', 'read_file', 'write_file', 'snapshot', 'restore'}
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+    
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _ClientState:
+    """单个客户端的令牌桶与调度状态"""
+    
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+        self.in_flight = 0
+        self.queued = 0
+        self.finish_tag = 0.0
+        self.admitted = 0
+        self.rejected = 0
+
+
+class AdmissionController:
+    """
+    准入控制器
+    
+    - 令牌桶限制每个客户端的请求速率，超限返回 429
+    - 耗时操作按加权公平队列（按虚拟完成时间排序）分配全局执行槽位，
+      单个客户端刷屏只会让自己排队，不会饿死其他客户端
+    - 队列已满或排队超时时返回 503，均带 Retry-After
+    """
+    
+    def __init__(self, rate=ADMISSION_RATE, burst=ADMISSION_BURST,
+                 max_concurrent=ADMISSION_MAX_CONCURRENT, per_client_concurrency=ADMISSION_PER_CLIENT_CONCURRENCY,
+                 max_queue=ADMISSION_MAX_QUEUE, per_client_queue=ADMISSION_PER_CLIENT_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.per_client_concurrency = per_client_concurrency
+        self.max_queue = max_queue
+        self.per_client_queue = per_client_queue
+        self.queue_timeout = queue_timeout
+        
+        self._cond = threading.Condition()
+        self._clients = {}
+        self._queue = []
+        self._seq = 0
+        self._depth = 0
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        self._rejected = {'rate_limited': 0, 'client_queue_full': 0, 'queue_full': 0, 'queue_timeout': 0}
+    
+    def _client(self, key, now):
+        state = self._clients.get(key)
+        if state is None:
+            if len(self._clients) >= 4096:
+                # 清理已回满且空闲的客户端，防止来源地址过多时无限增长
+                for k in [k for k, s in self._clients.items()
+                          if not s.in_flight and not s.queued and now - s.updated > self.burst / self.rate]:
+                    del self._clients[k]
+            state = self._clients[key] = _ClientState(self.burst, now)
+        return state
+    
+    def _reject(self, state, status, reason, retry_after):
+        state.rejected += 1
+        self._rejected[reason] += 1
+        raise AdmissionRejected(status, reason, max(1, math.ceil(retry_after)))
+    
+    def _dispatch(self):
+        """把空闲槽位分配给虚拟完成时间最小、且未达到单客户端并发上限的等待者"""
+        skipped = []
+        while self._in_flight < self.max_concurrent and self._queue:
+            tag, seq, waiter = heapq.heappop(self._queue)
+            if waiter['cancelled']:
+                continue
+            state = waiter['state']
+            if state.in_flight >= self.per_client_concurrency:
+                skipped.append((tag, seq, waiter))
+                continue
+            waiter['granted'] = True
+            state.queued -= 1
+            state.in_flight += 1
+            self._depth -= 1
+            self._in_flight += 1
+            self._virtual_time = max(self._virtual_time, tag)
+        for item in skipped:
+            heapq.heappush(self._queue, item)
+        self._cond.notify_all()
+    
+    @contextmanager
+    def admit(self, key, expensive=False, weight=1):
+        """
+        准入一个请求，被拒绝时抛出 AdmissionRejected
+        
+        Args:
+            key: 客户端标识
+            expensive: 是否为需要排队调度的耗时操作
+            weight: 调度权重
+        """
+        with self._cond:
+            now = time.monotonic()
+            state = self._client(key, now)
+            
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+            state.updated = now
+            if state.tokens < 1:
+                self._reject(state, 429, 'rate_limited', (1 - state.tokens) / self.rate)
+            state.tokens -= 1
+            
+            if expensive:
+                if state.queued >= self.per_client_queue:
+                    self._reject(state, 429, 'client_queue_full', state.queued / self.per_client_concurrency)
+                if self._depth >= self.max_queue:
+                    self._reject(state, 503, 'queue_full', self._depth / self.max_concurrent)
+                
+                state.finish_tag = max(self._virtual_time, state.finish_tag) + 1.0 / weight
+                waiter = {'state': state, 'granted': False, 'cancelled': False}
+                self._seq += 1
+                heapq.heappush(self._queue, (state.finish_tag, self._seq, waiter))
+                state.queued += 1
+                self._depth += 1
+                self._dispatch()
+                
+                deadline = now + self.queue_timeout
+                while not waiter['granted']:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        waiter['cancelled'] = True
+                        state.queued -= 1
+                        self._depth -= 1
+                        self._reject(state, 503, 'queue_timeout', self._depth / self.max_concurrent)
+                    self._cond.wait(remaining)
+            
+            state.admitted += 1
+        
+        try:
+            yield
+        finally:
+            if expensive:
+                with self._cond:
+                    state.in_flight -= 1
+                    self._in_flight -= 1
+                    self._dispatch()
+    
+    def stats(self):
+        """队列深度、执行中数量和拒绝次数"""
+        with self._cond:
+            return {
+                'in_flight': self._in_flight,
+                'queue_depth': self._depth,
+                'max_concurrent': self.max_concurrent,
+                'rejected': dict(self._rejected),
+                'clients': {
+                    key: {
+                        'in_flight': s.in_flight,
+                        'queued': s.queued,
+                        'admitted': s.admitted,
+                        'rejected': s.rejected
+                    }
+                    for key, s in self._clients.items()
+                }
+            }
+
+
+ADMISSION = AdmissionController()
+
+
+def client_identity(api_key, address):
+    """
+    根据 API Key（优先）或来源地址确定客户端标识和调度权重
+    
+    API Key 只以哈希前缀出现在标识中，不会通过 /api/status 泄露
+    """
+    if api_key:
+        digest = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+        return f'key:{digest}', ADMISSION_WEIGHTS.get(api_key, 1)
+    return f'addr:{address}', 1
+
+
+# ============================================
+# API 操作（HTTP 与 WebSocket 共用）
+# 每个操作返回 (响应数据, HTTP 状态码)
+# ============================================
+
+def op_status(data=None):
+    """获取 IDE 状态"""
+    import platform
+    import sys
+    
+    status = {
+        'status': 'running',
+        'workspace': WORKSPACE,
+        'python_version': sys.version,
+        'platform': platform.platform(),
+        'cwd': os.getcwd(),
+        'file_cache': FILE_CACHE.stats(),
+        'admission': ADMISSION.stats()
+    }
+    return status, 200
+
+
+def op_list_files(data=None):
+    """列出文件"""
+    path = WORKSPACE
+    files = []
+    
+    for item in os.listdir(path):
+        full_path = os.path.join(path, item)
+        files.append({
+            'name': item,
+            'type': 'directory' if os.path.isdir(full_path) else 'file',
+            'size': os.path.getsize(full_path) if os.path.isfile(full_path) else 0
+        })
+    
+    return {'files': files, 'path': path}, 200
+
+
+def load_file(filename):
+    """
+    通过缓存读取文件
+    
+    返回 (条目, None, 200)，失败时返回 (None, 错误数据, 状态码)
+    """
+    if not filename:
+        return None, {'error': 'filename is required'}, 400
+    
+    filepath = os.path.join(WORKSPACE, filename)
+    
+    if not os.path.exists(filepath):
+        return None, {'error': 'File not found'}, 404
+    
+    if os.path.isdir(filepath):
+        return None, {'error': 'Is a directory'}, 400
+    
+    try:
+        return FILE_CACHE.get(filepath, filename), None, 200
+    except Exception as e:
+        return None, {'error': str(e)}, 500
+
+
+def op_read_file(data):
+    """
+    读取文件内容
+    
+    data['binary'] 为真时 content 为原始 bytes（供 WebSocket 二进制帧使用）
+    """
+    filename = data.get('filename')
+    entry, error, status = load_file(filename)
+    if error:
+        return error, status
+    
+    if data.get('binary', False):
+        return {'filename': filename, 'content': entry.data}, 200
+    if entry.decode_error:
+        return {'error': entry.decode_error}, 500
+    return {'filename': filename, 'content': entry.text}, 200
+
+
+def op_write_file(data, blob=None):
+    """
+    写入文件
+    
+    blob 不为 None 时按二进制写入 blob，忽略 data['content']
+    """
+    filename = data.get('filename')
+    content = data.get('content', '') if blob is None else blob
+    
+    if not filename:
+        return {'error': 'filename is required'}, 400
+    
+    filepath = os.path.join(WORKSPACE, filename)
+    
+    # 确保目录存在
+    os.makedirs(os.path.dirname(filepath) if os.path.dirname(filepath) else WORKSPACE, exist_ok=True)
+    
+    try:
+        if blob is None:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(content)
+        else:
+            with open(filepath, 'wb') as f:
+                f.write(content)
+        FILE_CACHE.invalidate(filepath)
+        FILE_EVENTS.publish('write', filename)
+        return {'status': 'success', 'filename': filename, 'size': len(content)}, 200
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+def op_delete_file(data):
+    """删除文件"""
+    filename = data.get('filename')
+    
+    if not filename:
+        return {'error': 'filename is required'}, 400
+    
+    filepath = os.path.join(WORKSPACE, filename)
+    
+    if not os.path.exists(filepath):
+        return {'error': 'File not found'}, 404
+    
+    try:
+        if os.path.isdir(filepath):
+            import shutil
+            shutil.rmtree(filepath)
+        else:
+            os.remove(filepath)
+        FILE_CACHE.invalidate(filepath)
+        FILE_EVENTS.publish('delete', filename)
+        return {'status': 'success', 'deleted': filename}, 200
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+def op_mkdir(data):
+    """创建目录"""
+    dirname = data.get('dirname')
+    
+    if not dirname:
+        return {'error': 'dirname is required'}, 400
+    
+    filepath = os.path.join(WORKSPACE, dirname)
+    
+    try:
+        os.makedirs(filepath, exist_ok=True)
+        FILE_EVENTS.publish('mkdir', dirname)
+        return {'status': 'success', 'created': dirname}, 200
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+def op_execute(data, on_output=None):
+    """
+    执行 Shell 命令
+    
+    on_output 不为 None 时以流式方式执行：每读到一段输出就调用
+    on_output(stream_name, text)，最终结果中仍包含完整的 stdout/stderr
+    """
+    command = data.get('command')
+    timeout = data.get('timeout', 30)
+    
+    if not command:
+        return {'error': 'command is required'}, 400
+    
+    try:
+        if on_output is None:
+            result = subprocess.run(
+                command,
+                shell=True,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                cwd=WORKSPACE
+            )
+            returncode, stdout, stderr = result.returncode, result.stdout, result.stderr
+        else:
+            returncode, stdout, stderr = _run_streaming(command, timeout, on_output)
+        
+        return {
+            'status': 'success',
+            'command': command,
+            'returncode': returncode,
+            'stdout': stdout,
+            'stderr': stderr
+        }, 200
+    except subprocess.TimeoutExpired:
+        return {'error': f'Command timed out after {timeout}s'}, 500
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+def op_snapshot(data):
+    """创建工作区（或子目录）快照"""
+    try:
+        result = SNAPSHOTS.snapshot(
+            path=data.get('path', ''),
+            label=data.get('label'),
+            exclude=data.get('exclude') or ()
+        )
+        return {'status': 'success', **result}, 200
+    except (ValueError, FileNotFoundError) as e:
+        return {'error': str(e)}, 400
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+def op_restore(data):
+    """把快照所在目录恢复到快照时的状态，只重写有变化的文件"""
+    snapshot_id = data.get('snapshot_id')
+    
+    if not snapshot_id:
+        return {'error': 'snapshot_id is required'}, 400
+    
+    try:
+        result = SNAPSHOTS.restore(snapshot_id, dry_run=bool(data.get('dry_run')))
+    except FileNotFoundError:
+        return {'error': 'Snapshot not found'}, 404
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    except Exception as e:
+        return {'error': str(e)}, 500
+    
+    if not result['dry_run']:
+        FILE_CACHE.invalidate(os.path.normpath(os.path.join(WORKSPACE, result['path'])))
+        FILE_EVENTS.publish('restore', result['path'])
+    return {'status': 'success', **result}, 200
+
+
+def op_list_snapshots(data=None):
+    """列出快照"""
+    return {'snapshots': SNAPSHOTS.list_snapshots()}, 200
+
+
+def op_delete_snapshot(data):
+    """删除快照并回收无引用的对象"""
+    snapshot_id = data.get('snapshot_id')
+    
+    if not snapshot_id:
+        return {'error': 'snapshot_id is required'}, 400
+    
+    try:
+        return {'status': 'success', **SNAPSHOTS.delete(snapshot_id)}, 200
+    except FileNotFoundError:
+        return {'error': 'Snapshot not found'}, 404
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+def _run_streaming(command, timeout, on_output):
+    """执行命令并实时回调 stdout/stderr 输出，返回 (returncode, stdout, stderr)"""
+    proc = subprocess.Popen(
+        command,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=WORKSPACE,
+        start_new_session=True
+    )
+    collected = {'stdout': [], 'stderr': []}
+    
+    def pump(pipe, name):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = os.read(pipe.fileno(), 65536)
+            text = decoder.decode(chunk, final=not chunk)
+            if text:
+                collected[name].append(text)
+                on_output(name, text)
+            if not chunk:
+                break
+    
+    # stdout 与 stderr 并发读取，避免任一管道写满导致死锁
+    readers = [
+        threading.Thread(target=pump, args=(proc.stdout, 'stdout'), daemon=True),
+        threading.Thread(target=pump, args=(proc.stderr, 'stderr'), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+    
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # 杀掉整个进程组，否则子进程继续持有管道，读线程无法结束
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+        proc.stdout.close()
+        proc.stderr.close()
+    
+    return proc.returncode, ''.join(collected['stdout']), ''.join(collected['stderr'])
+
+
+# ============================================
+# WebSocket 多路复用协议
+# ============================================
+#
+# 连接地址：GET /api/ws（标准 WebSocket 握手），一条连接可并发执行多个操作
+#
+# 文本帧（JSON）：
+#   请求  {"id": 1, "op": "execute", "params": {"command": "ls", "stream": true}}
+#   响应  {"id": 1, "status": 200, "result": {...}}          # 按完成顺序返回，可能乱序
+#   事件  {"id": 1, "event": "stdout", "data": "..."}         # 流式命令输出
+#         {"id": 2, "event": "file", "data": {"action": "write", "path": "a.py"}}
+#
+# 二进制帧：4 字节大端长度 + JSON 元数据 + 原始文件内容
+#   - read_file 的 params 带 "binary": true 时，响应以二进制帧返回，元数据同文本响应（不含 content）
+#   - 客户端发送二进制帧写文件，元数据为 {"id": 3, "op": "write_file", "params": {"filename": "a.bin"}}
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+WS_MAX_WORKERS = 8
+
+WS_OP_CONTINUATION = 0x0
+WS_OP_TEXT = 0x1
+WS_OP_BINARY = 0x2
+WS_OP_CLOSE = 0x8
+WS_OP_PING = 0x9
+WS_OP_PONG = 0xA
+
+
+def _ws_read_exact(rfile, n):
+    """读取 n 字节，连接关闭时抛出 ConnectionError"""
+    data = rfile.read(n)
+    if len(data) < n:
+        raise ConnectionError('WebSocket 连接已关闭')
+    return data
+
+
+def _ws_apply_mask(payload, mask):
+    """按 RFC 6455 对负载做掩码运算（整数异或，避免逐字节循环）"""
+    n = len(payload)
+    if not n:
+        return payload
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(n, 'big')
+
+
+def ws_read_frame(rfile):
+    """读取一帧，返回 (fin, opcode, payload)"""
+    b1, b2 = _ws_read_exact(rfile, 2)
+    fin = bool(b1 & 0x80)
+    opcode = b1 & 0x0F
+    length = b2 & 0x7F
+    
+    if length == 126:
+        length = struct.unpack('!H', _ws_read_exact(rfile, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', _ws_read_exact(rfile, 8))[0]
+    if length > WS_MAX_MESSAGE_SIZE:
+        raise ConnectionError('WebSocket 帧过大')
+    
+    mask = _ws_read_exact(rfile, 4) if b2 & 0x80 else None
+    payload = _ws_read_exact(rfile, length) if length else b''
+    if mask:
+        payload = _ws_apply_mask(payload, mask)
+    return fin, opcode, payload
+
+
+def ws_encode_frame(opcode, payload):
+    """编码一帧（服务端发送，不加掩码）"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def ws_pack_binary(meta, data):
+    """打包二进制消息：元数据长度 + JSON 元数据 + 原始内容"""
+    header = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    return struct.pack('!I', len(header)) + header + data
+
+
+def ws_unpack_binary(payload):
+    """解包二进制消息，返回 (meta, data)"""
+    if len(payload) < 4:
+        raise ValueError('二进制帧格式错误')
+    size = struct.unpack('!I', payload[:4])[0]
+    meta = json.loads(payload[4:4 + size].decode('utf-8'))
+    return meta, payload[4 + size:]
+
+
+class WebSocketSession:
+    """一条 WebSocket 连接上的多路复用会话"""
+    
+    OPERATIONS = {
+        'status': op_status,
+        'list_files': op_list_files,
+        'read_file': op_read_file,
+        'write_file': op_write_file,
+        'delete_file': op_delete_file,
+        'mkdir': op_mkdir,
+        'execute': op_execute,
+        'snapshot': op_snapshot,
+        'restore': op_restore,
+        'list_snapshots': op_list_snapshots,
+        'delete_snapshot': op_delete_snapshot
+    }
+    
+    def __init__(self, rfile, wfile, client_id='ws', weight=1):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.client_id = client_id
+        self.weight = weight
+        self.closed = False
+        self._send_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=WS_MAX_WORKERS)
+        self._subscriptions = []
+    
+    def send(self, opcode, payload):
+        """发送一帧（多个工作线程共用连接，需加锁）"""
+        frame = ws_encode_frame(opcode, payload)
+        with self._send_lock:
+            if self.closed:
+                return
+            try:
+                self.wfile.write(frame)
+                self.wfile.flush()
+            except OSError:
+                self.closed = True
+    
+    def send_json(self, message):
+        """发送 JSON 文本帧"""
+        self.send(WS_OP_TEXT, json.dumps(message, ensure_ascii=False).encode('utf-8'))
+    
+    def run(self):
+        """读取并分发消息，直到连接关闭"""
+        try:
+            for opcode, payload in self._messages():
+                if opcode == WS_OP_TEXT:
+                    try:
+                        message = json.loads(payload.decode('utf-8'))
+                    except ValueError:
+                        self.send_json({'id': None, 'status': 400, 'result': {'error': 'Invalid JSON'}})
+                        continue
+                    self._dispatch(message, None)
+                elif opcode == WS_OP_BINARY:
+                    try:
+                        meta, blob = ws_unpack_binary(payload)
+                    except ValueError:
+                        self.send_json({'id': None, 'status': 400, 'result': {'error': 'Invalid binary frame'}})
+                        continue
+                    self._dispatch(meta, blob)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.close()
+    
+    def _messages(self):
+        """逐条产出完整消息，处理分片和控制帧"""
+        fragments = []
+        message_opcode = None
+        size = 0
+        
+        while True:
+            fin, opcode, payload = ws_read_frame(self.rfile)
+            
+            if opcode == WS_OP_CLOSE:
+                self.send(WS_OP_CLOSE, payload[:2])
+                return
+            if opcode == WS_OP_PING:
+                self.send(WS_OP_PONG, payload)
+                continue
+            if opcode == WS_OP_PONG:
+                continue
+            
+            if opcode != WS_OP_CONTINUATION:
+                message_opcode = opcode
+                fragments = []
+                size = 0
+            fragments.append(payload)
+            size += len(payload)
+            
+            if size > WS_MAX_MESSAGE_SIZE:
+                self.send(WS_OP_CLOSE, struct.pack('!H', 1009))
+                return
+            if fin:
+                yield message_opcode, b''.join(fragments)
+                fragments = []
+                size = 0
+    
+    def _dispatch(self, message, blob):
+        """分发一条请求，耗时操作交给线程池并发执行"""
+        if not isinstance(message, dict):
+            self.send_json({'id': None, 'status': 400, 'result': {'error': 'Message must be a JSON object'}})
+            return
+        
+        req_id = message.get('id')
+        op = message.get('op')
+        params = message.get('params') or {}
+        
+        if not isinstance(params, dict):
+            self.send_json({'id': req_id, 'status': 400, 'result': {'error': 'params must be a JSON object'}})
+            return
+        
+        if op == 'subscribe':
+            # 订阅文件变更事件，事件沿用本次请求的 id 推送
+            token = FILE_EVENTS.subscribe(
+                lambda event: self.send_json({'id': req_id, 'event': 'file', 'data': event})
+            )
+            self._subscriptions.append(token)
+            self.send_json({'id': req_id, 'status': 200, 'result': {'status': 'subscribed'}})
+            return
+        
+        if op not in self.OPERATIONS:
+            self.send_json({'id': req_id, 'status': 404, 'result': {'error': f'Unknown op: {op}'}})
+            return
+        
+        self._executor.submit(self._run_op, req_id, op, params, blob)
+    
+    def _run_op(self, req_id, op, params, blob):
+        """执行单个操作并回送结果"""
+        try:
+            with ADMISSION.admit(self.client_id, op in EXPENSIVE_OPS, self.weight):
+                if op == 'write_file' and blob is not None:
+                    result, status = op_write_file(params, blob)
+                elif op == 'execute' and params.get('stream'):
+                    result, status = op_execute(
+                        params,
+                        on_output=lambda name, text: self.send_json({'id': req_id, 'event': name, 'data': text})
+                    )
+                else:
+                    result, status = self.OPERATIONS[op](params)
+        except AdmissionRejected as e:
+            result, status = {'error': 'Too many requests', 'reason': e.reason, 'retry_after': e.retry_after}, e.status
+        except Exception as e:
+            result, status = {'error': str(e), 'traceback': traceback.format_exc()}, 500
+        
+        content = result.get('content')
+        if isinstance(content, bytes):
+            meta = {
+                'id': req_id,
+                'status': status,
+                'result': {k: v for k, v in result.items() if k != 'content'}
+            }
+            self.send(WS_OP_BINARY, ws_pack_binary(meta, content))
+        else:
+            self.send_json({'id': req_id, 'status': status, 'result': result})
+    
+    def close(self):
+        """释放订阅和线程池"""
+        for token in self._subscriptions:
+            FILE_EVENTS.unsubscribe(token)
+        self._subscriptions = []
+        with self._send_lock:
+            self.closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 class IDEAPIHandler(BaseHTTPRequestHandler):
     """IDE API 请求处理器"""
     
-    def _send_json(self, data, status=200):
+    # 使用 HTTP/1.1 长连接，同一客户端的连续调用可复用连接
+    protocol_version = 'HTTP/1.1'
+    
+    # 空闲长连接的超时时间（秒），避免空闲连接一直占用服务线程
+    timeout = 60
+    
+    def _send_json(self, data, status=200, headers=None):
         """发送 JSON 响应"""
+        self._send_json_body(json.dumps(data, ensure_ascii=False).encode('utf-8'), status, headers)
+    
+    def _send_json_body(self, body, status=200, headers=None):
+        """发送已编码的 JSON 响应体"""
         self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-API-Key')
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(body)
     
     def do_OPTIONS(self):
         """处理 CORS 预检请求"""
@@ -42,20 +1048,31 @@ class IDEAPIHandler(BaseHTTPRequestHandler):
         path = parsed.path
         
         try:
-            if path == '/':
-                self._handle_root()
-            elif path == '/api/status':
-                self._handle_status()
-            elif path == '/api/files':
-                self._handle_list_files()
-            elif path.startswith('/api/file/'):
-                filename = path[10:]  # 去掉 /api/file/
-                self._handle_read_file(filename)
-            else:
-                self._send_json({'error': 'Not found'}, 404)
+            with self._admit(path, expensive=path.startswith('/api/file/')):
+                self._route_get(path)
+        except AdmissionRejected as e:
+            self._send_rejection(e)
         except Exception as e:
             self._send_json({'error': str(e), 'traceback': traceback.format_exc()}, 500)
     
+    def _route_get(self, path):
+        """GET 路由"""
+        if path == '/':
+            self._handle_root()
+        elif path == '/api/status':
+            self._handle_status()
+        elif path == '/api/files':
+            self._handle_list_files()
+        elif path == '/api/ws':
+            self._handle_websocket()
+        elif path == '/api/snapshots':
+            self._send_json(*op_list_snapshots())
+        elif path.startswith('/api/file/'):
+            filename = path[10:]  # 去掉 /api/file/
+            self._handle_read_file(filename)
+        else:
+            self._send_json({'error': 'Not found'}, 404)
+    
     def do_POST(self):
         """处理 POST 请求"""
         parsed = urlparse(self.path)
@@ -71,19 +1088,53 @@ class IDEAPIHandler(BaseHTTPRequestHandler):
             data = {}
         
         try:
-            if path == '/api/execute':
-                self._handle_execute(data)
-            elif path == '/api/file':
-                self._handle_write_file(data)
-            elif path == '/api/delete':
-                self._handle_delete_file(data)
-            elif path == '/api/mkdir':
-                self._handle_mkdir(data)
-            else:
-                self._send_json({'error': 'Not found'}, 404)
+            expensive = path in ('/api/execute', '/api/file', '/api/snapshot', '/api/restore')
+            with self._admit(path, expensive=expensive):
+                self._route_post(path, data)
+        except AdmissionRejected as e:
+            self._send_rejection(e)
         except Exception as e:
             self._send_json({'error': str(e), 'traceback': traceback.format_exc()}, 500)
     
+    def _route_post(self, path, data):
+        """POST 路由"""
+        if path == '/api/execute':
+            self._handle_execute(data)
+        elif path == '/api/file':
+            self._handle_write_file(data)
+        elif path == '/api/delete':
+            self._handle_delete_file(data)
+        elif path == '/api/mkdir':
+            self._handle_mkdir(data)
+        elif path == '/api/snapshot':
+            self._send_json(*op_snapshot(data))
+        elif path == '/api/restore':
+            self._send_json(*op_restore(data))
+        elif path == '/api/snapshot/delete':
+            self._send_json(*op_delete_snapshot(data))
+        else:
+            self._send_json({'error': 'Not found'}, 404)
+    
+    def _client_identity(self):
+        """客户端标识与调度权重（API Key 优先，否则按来源地址）"""
+        return client_identity(self.headers.get('X-API-Key'), self.client_address[0])
+    
+    def _admit(self, path, expensive):
+        """准入控制；API 文档和状态接口不受限，保证健康检查始终可用"""
+        if path in ('/', '/api/status'):
+            return nullcontext()
+        client_id, weight = self._client_identity()
+        return ADMISSION.admit(client_id, expensive, weight)
+    
+    def _send_rejection(self, e):
+        """发送 429/503 拒绝响应"""
+        self._send_json(
+            {'error': 'Too many requests' if e.status == 429 else 'Server overloaded',
+             'reason': e.reason, 'retry_after': e.retry_after},
+            e.status,
+            headers={'Retry-After': str(e.retry_after)}
+        )
+    
     def _handle_root(self):
         """根路径 - API 文档"""
         docs = {
@@ -96,7 +1147,12 @@ class IDEAPIHandler(BaseHTTPRequestHandler):
                 'POST /api/execute': '执行 Shell 命令',
                 'POST /api/file': '创建/写入文件',
                 'POST /api/delete': '删除文件',
-                'POST /api/mkdir': '创建目录'
+                'POST /api/mkdir': '创建目录',
+                'GET /api/ws': 'WebSocket 多路复用通道',
+                'POST /api/snapshot': '创建工作区快照',
+                'GET /api/snapshots': '列出快照',
+                'POST /api/restore': '恢复快照（只重写变化的文件）',
+                'POST /api/snapshot/delete': '删除快照'
             },
             'examples': {
                 'execute_command': {
@@ -113,173 +1169,204 @@ class IDEAPIHandler(BaseHTTPRequestHandler):
         }
         self._send_json(docs)
     
+    def _handle_websocket(self):
+        """升级为 WebSocket 连接并进入多路复用会话"""
+        key = self.headers.get('Sec-WebSocket-Key')
+        if self.headers.get('Upgrade', '').lower() != 'websocket' or not key:
+            self._send_json({'error': 'WebSocket upgrade required'}, 426)
+            return
+        
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        
+        # WebSocket 连接允许长时间空闲，不受 HTTP 空闲超时限制
+        self.connection.settimeout(None)
+        client_id, weight = self._client_identity()
+        WebSocketSession(self.rfile, self.wfile, client_id, weight).run()
+        self.close_connection = True
+    
     def _handle_status(self):
         """获取 IDE 状态"""
-        import platform
-        import sys
-        
-        status = {
-            'status': 'running',
-            'workspace': WORKSPACE,
-            'python_version': sys.version,
-            'platform': platform.platform(),
-            'cwd': os.getcwd()
-        }
-        self._send_json(status)
+        self._send_json(*op_status())
     
     def _handle_list_files(self):
         """列出文件"""
-        path = WORKSPACE
-        files = []
-        
-        for item in os.listdir(path):
-            full_path = os.path.join(path, item)
-            files.append({
-                'name': item,
-                'type': 'directory' if os.path.isdir(full_path) else 'file',
-                'size': os.path.getsize(full_path) if os.path.isfile(full_path) else 0
-            })
-        
-        self._send_json({'files': files, 'path': path})
+        self._send_json(*op_list_files())
     
     def _handle_read_file(self, filename):
-        """读取文件内容"""
-        filepath = os.path.join(WORKSPACE, filename)
-        
-        if not os.path.exists(filepath):
-            self._send_json({'error': 'File not found'}, 404)
-            return
-        
-        if os.path.isdir(filepath):
-            self._send_json({'error': 'Is a directory'}, 400)
-            return
-        
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            self._send_json({'filename': filename, 'content': content})
-        except Exception as e:
-            self._send_json({'error': str(e)}, 500)
+        """读取文件内容（命中缓存时直接发送预编码的响应体）"""
+        entry, error, status = load_file(filename)
+        if error:
+            self._send_json(error, status)
+        elif entry.decode_error:
+            self._send_json({'error': entry.decode_error}, 500)
+        else:
+            self._send_json_body(entry.json_body(filename))
     
     def _handle_write_file(self, data):
         """写入文件"""
-        filename = data.get('filename')
-        content = data.get('content', '')
-        
-        if not filename:
-            self._send_json({'error': 'filename is required'}, 400)
-            return
-        
-        filepath = os.path.join(WORKSPACE, filename)
-        
-        # 确保目录存在
-        os.makedirs(os.path.dirname(filepath) if os.path.dirname(filepath) else WORKSPACE, exist_ok=True)
-        
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            self._send_json({'status': 'success', 'filename': filename, 'size': len(content)})
-        except Exception as e:
-            self._send_json({'error': str(e)}, 500)
+        self._send_json(*op_write_file(data))
     
     def _handle_delete_file(self, data):
         """删除文件"""
-        filename = data.get('filename')
-        
-        if not filename:
-            self._send_json({'error': 'filename is required'}, 400)
-            return
-        
-        filepath = os.path.join(WORKSPACE, filename)
-        
-        if not os.path.exists(filepath):
-            self._send_json({'error': 'File not found'}, 404)
-            return
-        
-        try:
-            if os.path.isdir(filepath):
-                import shutil
-                shutil.rmtree(filepath)
-            else:
-                os.remove(filepath)
-            self._send_json({'status': 'success', 'deleted': filename})
-        except Exception as e:
-            self._send_json({'error': str(e)}, 500)
+        self._send_json(*op_delete_file(data))
     
     def _handle_mkdir(self, data):
         """创建目录"""
-        dirname = data.get('dirname')
-        
-        if not dirname:
-            self._send_json({'error': 'dirname is required'}, 400)
-            return
-        
-        filepath = os.path.join(WORKSPACE, dirname)
-        
-        try:
-            os.makedirs(filepath, exist_ok=True)
-            self._send_json({'status': 'success', 'created': dirname})
-        except Exception as e:
-            self._send_json({'error': str(e)}, 500)
+        self._send_json(*op_mkdir(data))
     
     def _handle_execute(self, data):
         """执行 Shell 命令"""
-        command = data.get('command')
-        timeout = data.get('timeout', 30)
-        
-        if not command:
-            self._send_json({'error': 'command is required'}, 400)
-            return
-        
-        try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                cwd=WORKSPACE
-            )
-            
-            self._send_json({
-                'status': 'success',
-                'command': command,
-                'returncode': result.returncode,
-                'stdout': result.stdout,
-                'stderr': result.stderr
-            })
-        except subprocess.TimeoutExpired:
-            self._send_json({'error': f'Command timed out after {timeout}s'}, 500)
-        except Exception as e:
-            self._send_json({'error': str(e)}, 500)
+        self._send_json(*op_execute(data))
     
     def log_message(self, format, *args):
         """自定义日志格式"""
         print(f"[API] {args[0]}")
 
 
-def run_server(port=8080):
-    """启动 API 服务器"""
+# 监听队列长度：socketserver 默认只有 5，突发连接多时客户端会收到 ConnectionResetError
+LISTEN_BACKLOG = 128
+
+
+class TCPHTTPServer(ThreadingHTTPServer):
+    """监听 TCP 端口的 HTTP 服务器"""
+    
+    request_queue_size = LISTEN_BACKLOG
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    监听 Unix 域套接字的 HTTP 服务器
+    
+    与 api_server.py 运行在同一主机/容器内的 AI 代理可直接通过套接字文件访问，
+    省去 TCP 协议栈开销；访问控制由套接字文件权限决定，无需对外暴露端口。
+    """
+    
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+    
+    def __init__(self, socket_path, handler_class, mode=0o660):
+        self.socket_mode = mode
+        self._remove_stale_socket(socket_path)
+        super().__init__(socket_path, handler_class)
+    
+    @staticmethod
+    def _remove_stale_socket(socket_path):
+        """清理上次异常退出遗留的套接字文件"""
+        try:
+            st = os.stat(socket_path)
+        except FileNotFoundError:
+            return
+        
+        if not stat.S_ISSOCK(st.st_mode):
+            raise OSError(f'{socket_path} 已存在且不是套接字文件')
+        
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(socket_path)
+        else:
+            raise OSError(f'{socket_path} 已被其他服务占用')
+        finally:
+            probe.close()
+    
+    def server_bind(self):
+        """绑定套接字并设置文件权限"""
+        # bind 时即以目标权限创建文件，避免 chmod 之前出现可被任意用户连接的窗口
+        old_umask = os.umask(0o777 & ~self.socket_mode)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.server_address, self.socket_mode)
+        
+        # BaseHTTPRequestHandler 需要以下属性
+        self.server_name = 'localhost'
+        self.server_port = 0
+    
+    def get_request(self):
+        """Unix 套接字没有对端地址，补一个占位地址供日志等使用"""
+        request, _ = self.socket.accept()
+        return request, ('unix', 0)
+    
+    def server_close(self):
+        """关闭服务器并删除套接字文件"""
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def run_server(port=8080, host='0.0.0.0', unix_socket=None, socket_mode=0o660):
+    """
+    启动 API 服务器
+    
+    Args:
+        port: TCP 端口，为 None 时不监听 TCP（仅 Unix 套接字）
+        host: TCP 监听地址
+        unix_socket: Unix 域套接字路径，为 None 时不监听
+        socket_mode: Unix 套接字文件权限
+    """
     # 确保工作目录存在
     os.makedirs(WORKSPACE, exist_ok=True)
     
-    server = HTTPServer(('0.0.0.0', port), IDEAPIHandler)
+    servers = []
+    if port is not None:
+        servers.append(TCPHTTPServer((host, port), IDEAPIHandler))
+    if unix_socket:
+        servers.append(UnixHTTPServer(unix_socket, IDEAPIHandler, mode=socket_mode))
+    if not servers:
+        raise ValueError('至少需要监听一个 TCP 端口或 Unix 套接字')
     
     print("=" * 60)
     print("🚀 AI Cloud IDE API Server")
     print("=" * 60)
-    print(f"🌐 服务地址: http://localhost:{port}")
+    if port is not None:
+        print(f"🌐 服务地址: http://localhost:{port}")
+    if unix_socket:
+        print(f"🔌 Unix 套接字: unix://{unix_socket} (权限 {socket_mode:o})")
     print(f"📁 工作目录: {WORKSPACE}")
-    print(f"📖 API 文档: http://localhost:{port}/")
+    if port is not None:
+        print(f"📖 API 文档: http://localhost:{port}/")
     print("=" * 60)
     print("\n按 Ctrl+C 停止服务\n")
     
+    # 多个监听端点时，其余端点在后台线程中运行
+    for server in servers[1:]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    
     try:
-        server.serve_forever()
+        servers[0].serve_forever()
     except KeyboardInterrupt:
         print("\n👋 服务已停止")
-        server.shutdown()
+    finally:
+        for server in servers[1:]:
+            server.shutdown()
+        for server in servers:
+            server.server_close()
 
 
 if __name__ == '__main__':
-    run_server()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='AI Cloud IDE API Server')
+    parser.add_argument('--port', type=int, default=8080, help='TCP 端口（默认 8080）')
+    parser.add_argument('--host', default='0.0.0.0', help='TCP 监听地址')
+    parser.add_argument('--unix-socket', help='同时监听的 Unix 域套接字路径')
+    parser.add_argument('--socket-mode', type=lambda v: int(v, 8), default=0o660,
+                        help='Unix 套接字文件权限（八进制，默认 660）')
+    parser.add_argument('--no-tcp', action='store_true', help='不监听 TCP，仅使用 Unix 套接字')
+    args = parser.parse_args()
+    
+    run_server(
+        port=None if args.no_tcp else args.port,
+        host=args.host,
+        unix_socket=args.unix_socket,
+        socket_mode=args.socket_mode
+    )
@@ -3,10 +3,20 @@
 简单的 Web 服务器示例
 运行: python server.py
 访问: http://localhost:8080
+
+生产静态文件模式（多线程、ETag/Cache-Control、sendfile、预压缩文件、小文件内存缓存）:
+运行: python server.py --static --dir dist
 """
 
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import HTTPServer, ThreadingHTTPServer, SimpleHTTPRequestHandler
+from collections import OrderedDict
+from email.utils import formatdate
+from functools import partial
+import argparse
 import json
+import os
+import re
+import threading
 
 class APIHandler(SimpleHTTPRequestHandler):
     def do_GET(self):
@@ -23,9 +33,177 @@ class APIHandler(SimpleHTTPRequestHandler):
         else:
             super().do_GET()
 
+
+class SmallFileCache:
+    """小文件内存缓存，按修改时间和大小校验，超出容量时淘汰最久未用的文件"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_file_size=256 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, path, st):
+        """返回缓存内容，文件已变化或未缓存时返回 None"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            if entry[0] != (st.st_mtime_ns, st.st_size):
+                self._bytes -= len(self._entries.pop(path)[1])
+                return None
+            self._entries.move_to_end(path)
+            return entry[1]
+
+    def put(self, path, st, data):
+        if len(data) > self.max_file_size:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[path] = ((st.st_mtime_ns, st.st_size), data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+class StaticHandler(APIHandler):
+    """
+    生产静态文件处理器
+
+    - HTTP/1.1 长连接，配合 ThreadingHTTPServer 并发处理
+    - ETag / Last-Modified，If-None-Match 命中时返回 304
+    - 带内容哈希的文件名（如 app.3f9a2b1c.js）长期缓存，其余文件每次向服务器校验
+    - 客户端支持时优先发送同目录下预压缩的 .br / .gz 文件
+    - 小文件从内存缓存发送，大文件使用 sendfile 零拷贝发送
+    """
+
+    protocol_version = 'HTTP/1.1'
+    cache = SmallFileCache()
+
+    # 文件名中带 8 位以上十六进制哈希的视为不可变资源；哈希必须含字母，
+    # 避免把 report-20240101.js 这类日期戳当成哈希。构建工具的命名规则不同时可在子类中覆盖
+    FINGERPRINT_RE = re.compile(r'[.-](?=[0-9]*[a-f])[0-9a-f]{8,}\.[A-Za-z0-9]+$')
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    def do_GET(self):
+        if self.path == '/api/hello':
+            # 示例接口按 HTTP/1.0 风格不带 Content-Length，响应后关闭连接
+            self.close_connection = True
+            super().do_GET()
+        else:
+            self._serve_static(head_only=False)
+
+    def do_HEAD(self):
+        self._serve_static(head_only=True)
+
+    def _accepted_encodings(self):
+        """解析 Accept-Encoding，返回 q 值大于 0 的编码集合（q=0 表示明确拒绝）"""
+        accepted = set()
+        for token in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = token.partition(';')
+            q = 1.0
+            for param in params.split(';'):
+                key, _, value = param.partition('=')
+                if key.strip().lower() == 'q':
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            if q > 0:
+                accepted.add(name.strip().lower())
+        return accepted
+
+    def _select_variant(self, path):
+        """按 Accept-Encoding 选择预压缩文件，返回 (实际路径, 编码)"""
+        accepted = self._accepted_encodings()
+        for encoding, suffix in self.ENCODINGS:
+            if encoding in accepted and os.path.isfile(path + suffix):
+                return path + suffix, encoding
+        return path, None
+
+    def _serve_static(self, head_only):
+        path = self.translate_path(self.path)
+
+        if os.path.isdir(path):
+            index = os.path.join(path, 'index.html')
+            if not self.path.split('?', 1)[0].endswith('/') or not os.path.isfile(index):
+                # 目录重定向和目录列表沿用标准实现
+                self.close_connection = True
+                return super().do_GET() if not head_only else super().do_HEAD()
+            path = index
+
+        if not os.path.isfile(path):
+            self.send_error(404, 'File not found')
+            return
+
+        variant, encoding = self._select_variant(path)
+        try:
+            st = os.stat(variant)
+        except OSError:
+            self.send_error(404, 'File not found')
+            return
+
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-" + encoding if encoding else ""}"'
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self._send_cache_headers(path, etag, st)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(st.st_size))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self._send_cache_headers(path, etag, st)
+        self.end_headers()
+
+        if head_only:
+            return
+
+        data = self.cache.get(variant, st)
+        if data is not None:
+            self.wfile.write(data)
+            return
+
+        with open(variant, 'rb') as f:
+            if st.st_size <= self.cache.max_file_size:
+                data = f.read(st.st_size)
+                self.cache.put(variant, os.fstat(f.fileno()), data)
+                self.wfile.write(data)
+            else:
+                # socket.sendfile 在支持时走 os.sendfile，不经过 Python 缓冲区；
+                # 只发送 Content-Length 声明的字节数，文件在发送期间变长也不会破坏长连接
+                self.connection.sendfile(f, count=st.st_size)
+
+    def _send_cache_headers(self, path, etag, st):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(st.st_mtime, usegmt=True))
+        self.send_header('Vary', 'Accept-Encoding')
+        if self.FINGERPRINT_RE.search(os.path.basename(path)):
+            self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+        else:
+            self.send_header('Cache-Control', 'public, no-cache')
+
+
 if __name__ == '__main__':
-    PORT = 8080
-    server = HTTPServer(('0.0.0.0', PORT), APIHandler)
+    parser = argparse.ArgumentParser(description='AI Cloud IDE Web Server')
+    parser.add_argument('--port', type=int, default=8080, help='端口（默认 8080）')
+    parser.add_argument('--static', action='store_true', help='生产静态文件模式')
+    parser.add_argument('--dir', default=os.getcwd(), help='静态文件根目录（默认当前目录）')
+    args = parser.parse_args()
+
+    PORT = args.port
+    if args.static:
+        server = ThreadingHTTPServer(('0.0.0.0', PORT), partial(StaticHandler, directory=args.dir))
+        print(f"📦 Static mode, serving {args.dir}")
+    else:
+        server = HTTPServer(('0.0.0.0', PORT), APIHandler)
     print(f"🌐 Server running at http://localhost:{PORT}")
     print(f"📡 API endpoint: http://localhost:{PORT}/api/hello")
     print("Press Ctrl+C to stop...")
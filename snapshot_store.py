@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作区快照存储
+供 api_server.py 的快照/恢复接口使用
+
+存储结构（默认位于 ~/.ide-snapshots）：
+    objects/ab/abcdef...   按 SHA-256 内容寻址的文件对象（只读，多个快照共享）
+    snapshots/<id>.json    快照清单：相对路径 -> 对象哈希、权限
+    index.json             文件状态索引：(mtime, ctime, size, inode) -> 哈希
+
+未变化的文件靠状态索引跳过哈希计算，内容相同的文件只存一份对象，
+因此快照开销与变化的文件数量成正比，而不是整棵目录树的大小。
+新对象优先使用 reflink（写时复制）克隆，不支持时退回普通复制。
+"""
+
+import os
+import json
+import stat
+import time
+import shutil
+import fnmatch
+import hashlib
+import threading
+
+# Linux FICLONE ioctl（btrfs / xfs 等支持 reflink 的文件系统）
+FICLONE = 0x40049409
+
+
+def clone_file(src, dst):
+    """
+    克隆文件内容，返回使用的方式（'reflink' 或 'copy'）
+    
+    reflink 只复制元数据，数据块在写入前与源文件共享
+    """
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return 'reflink'
+    except (ImportError, OSError):
+        shutil.copyfile(src, dst)
+        return 'copy'
+
+
+def hash_file(path):
+    """计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotStore:
+    """内容寻址的工作区快照存储"""
+    
+    def __init__(self, workspace, store_dir):
+        self.workspace = os.path.abspath(workspace)
+        self.store_dir = os.path.abspath(store_dir)
+        self.objects_dir = os.path.join(self.store_dir, 'objects')
+        self.snapshots_dir = os.path.join(self.store_dir, 'snapshots')
+        self.index_path = os.path.join(self.store_dir, 'index.json')
+        self._lock = threading.Lock()
+        self._index = None
+    
+    # ---------- 内部工具 ----------
+    
+    def _ensure_dirs(self):
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        if self._index is None:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._index = {}
+    
+    def _save_index(self):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self.index_path)
+    
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+    
+    def _manifest_path(self, snapshot_id):
+        if not snapshot_id or os.sep in snapshot_id or snapshot_id.startswith('.'):
+            raise ValueError(f'无效的快照 ID: {snapshot_id}')
+        return os.path.join(self.snapshots_dir, f'{snapshot_id}.json')
+    
+    def _resolve_root(self, path):
+        """把相对工作区的子目录转换为绝对路径，并禁止越出工作区"""
+        root = os.path.abspath(os.path.join(self.workspace, path or ''))
+        if root != self.workspace and not root.startswith(self.workspace + os.sep):
+            raise ValueError(f'路径超出工作区: {path}')
+        return root
+    
+    @staticmethod
+    def _signature(st):
+        return [st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino]
+    
+    def _cached_hash(self, path, st):
+        """状态未变化时直接返回索引中的哈希"""
+        entry = self._index.get(path)
+        if entry and entry[:4] == self._signature(st):
+            return entry[4]
+        return None
+    
+    def _walk(self, root, exclude):
+        """
+        遍历目录树，产出 (相对路径, 绝对路径, stat 结果)
+        
+        不跟随符号链接，跳过快照存储目录和 exclude 中匹配名称的条目
+        """
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            with os.scandir(current) as it:
+                for entry in it:
+                    if any(fnmatch.fnmatch(entry.name, pattern) for pattern in exclude):
+                        continue
+                    if entry.path == self.store_dir:
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    yield os.path.relpath(entry.path, root), entry.path, st
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+    
+    def _ingest(self, path):
+        """
+        把变化的文件存入对象库，返回 (哈希, 是否新对象, 克隆方式)
+        
+        先克隆到临时文件再对副本计算哈希，保证对象内容与哈希一致
+        """
+        tmp = os.path.join(self.objects_dir, f'.tmp-{os.getpid()}-{threading.get_ident()}')
+        method = clone_file(path, tmp)
+        digest = hash_file(tmp)
+        target = self._object_path(digest)
+        
+        if os.path.exists(target):
+            os.remove(tmp)
+            return digest, False, method
+        
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, target)
+        return digest, True, method
+    
+    def _load_manifest(self, snapshot_id):
+        with open(self._manifest_path(snapshot_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _save_manifest(self, manifest):
+        """先写临时文件再替换，读取方不会看到写了一半的清单"""
+        path = self._manifest_path(manifest['id'])
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    
+    def _iter_manifests(self):
+        """遍历所有可读的快照清单，跳过已被删除或损坏的清单"""
+        for name in os.listdir(self.snapshots_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                yield self._load_manifest(name[:-5])
+            except (OSError, ValueError):
+                continue
+    
+    # ---------- 对外接口 ----------
+    
+    def snapshot(self, path='', label=None, exclude=()):
+        """
+        为工作区（或子目录）创建快照
+        
+        Args:
+            path: 相对工作区的子目录，默认整个工作区
+            label: 可选的快照说明
+            exclude: 要跳过的文件/目录名通配符，如 ['node_modules', '*.pyc']
+        """
+        started = time.time()
+        root = self._resolve_root(path)
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f'目录不存在: {path}')
+        
+        with self._lock:
+            self._ensure_dirs()
+            files, dirs, symlinks = {}, [], {}
+            stats = {'hashed': 0, 'new_objects': 0, 'bytes_stored': 0, 'reflinks': 0}
+            
+            for rel, full, st in self._walk(root, exclude):
+                mode = st.st_mode
+                if stat.S_ISLNK(mode):
+                    symlinks[rel] = os.readlink(full)
+                elif stat.S_ISDIR(mode):
+                    dirs.append(rel)
+                elif stat.S_ISREG(mode):
+                    digest = self._cached_hash(full, st)
+                    if digest is None:
+                        digest, created, method = self._ingest(full)
+                        self._index[full] = self._signature(st) + [digest]
+                        stats['hashed'] += 1
+                        if created:
+                            stats['new_objects'] += 1
+                            stats['bytes_stored'] += st.st_size
+                            stats['reflinks'] += method == 'reflink'
+                    files[rel] = {'hash': digest, 'mode': mode & 0o7777, 'size': st.st_size}
+            
+            snapshot_id = time.strftime('%Y%m%d-%H%M%S') + '-' + os.urandom(3).hex()
+            manifest = {
+                'id': snapshot_id,
+                'label': label,
+                'path': os.path.relpath(root, self.workspace),
+                'created': time.time(),
+                'exclude': list(exclude),
+                'files': files,
+                'dirs': sorted(dirs),
+                'symlinks': symlinks
+            }
+            self._save_manifest(manifest)
+            self._save_index()
+        
+        return {
+            'snapshot_id': snapshot_id,
+            'path': manifest['path'],
+            'files': len(files),
+            'elapsed': round(time.time() - started, 3),
+            **stats
+        }
+    
+    def restore(self, snapshot_id, dry_run=False):
+        """
+        把快照所在目录恢复到快照时的状态
+        
+        只重写内容或权限有变化的文件，删除快照之后新增的条目，未变化的文件保持不动
+        """
+        started = time.time()
+        
+        with self._lock:
+            self._ensure_dirs()
+            manifest = self._load_manifest(snapshot_id)
+            root = self._resolve_root(manifest['path'])
+            os.makedirs(root, exist_ok=True)
+            wanted_files = manifest['files']
+            wanted_links = manifest['symlinks']
+            wanted_dirs = set(manifest['dirs'])
+            result = {'written': [], 'deleted': [], 'unchanged': 0}
+            
+            # 1. 删除快照中不存在（或类型不同）的条目
+            current_dirs = []
+            for rel, full, st in list(self._walk(root, manifest.get('exclude', []))):
+                mode = st.st_mode
+                if stat.S_ISDIR(mode):
+                    current_dirs.append((rel, full))
+                    continue
+                if stat.S_ISLNK(mode):
+                    keep = wanted_links.get(rel) == os.readlink(full)
+                elif stat.S_ISREG(mode):
+                    keep = rel in wanted_files
+                else:
+                    keep = False
+                if not keep:
+                    result['deleted'].append(rel)
+                    if not dry_run:
+                        os.remove(full)
+                        self._index.pop(full, None)
+            
+            for rel, full in sorted(current_dirs, key=lambda d: d[0].count(os.sep), reverse=True):
+                if rel not in wanted_dirs:
+                    result['deleted'].append(rel + '/')
+                    if not dry_run:
+                        shutil.rmtree(full, ignore_errors=True)
+            
+            # 2. 创建目录
+            if not dry_run:
+                for rel in sorted(wanted_dirs):
+                    os.makedirs(os.path.join(root, rel), exist_ok=True)
+            
+            # 3. 只重写内容或权限变化的文件
+            for rel, info in wanted_files.items():
+                full = os.path.join(root, rel)
+                try:
+                    st = os.lstat(full)
+                except FileNotFoundError:
+                    st = None
+                
+                if st is not None and stat.S_ISREG(st.st_mode):
+                    digest = self._cached_hash(full, st) or hash_file(full)
+                    if digest == info['hash']:
+                        # 只记录对象库中已有的哈希，索引才能安全地用于跳过入库
+                        self._index[full] = self._signature(st) + [digest]
+                        if (st.st_mode & 0o7777) != info['mode'] and not dry_run:
+                            os.chmod(full, info['mode'])
+                        result['unchanged'] += 1
+                        continue
+                
+                result['written'].append(rel)
+                if dry_run:
+                    continue
+                
+                # 写入临时文件后原子替换，避免修改可能被其他路径共享的 inode
+                tmp = os.path.join(os.path.dirname(full), f'.{os.path.basename(full)}.restore-tmp')
+                clone_file(self._object_path(info['hash']), tmp)
+                os.chmod(tmp, info['mode'])
+                os.replace(tmp, full)
+                self._index[full] = self._signature(os.lstat(full)) + [info['hash']]
+            
+            # 4. 符号链接
+            for rel, target in wanted_links.items():
+                full = os.path.join(root, rel)
+                if os.path.islink(full) and os.readlink(full) == target:
+                    continue
+                result['written'].append(rel)
+                if not dry_run:
+                    os.symlink(target, full)
+            
+            if not dry_run:
+                self._save_index()
+        
+        return {
+            'snapshot_id': snapshot_id,
+            'path': manifest['path'],
+            'dry_run': dry_run,
+            'written': result['written'],
+            'deleted': result['deleted'],
+            'unchanged': result['unchanged'],
+            'elapsed': round(time.time() - started, 3)
+        }
+    
+    def list_snapshots(self):
+        """列出所有快照（不含文件清单），按创建时间从早到晚排列"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        
+        snapshots = []
+        for manifest in self._iter_manifests():
+            snapshots.append({
+                'id': manifest['id'],
+                'label': manifest.get('label'),
+                'path': manifest['path'],
+                'created': manifest['created'],
+                'files': len(manifest['files']),
+                'size': sum(info['size'] for info in manifest['files'].values())
+            })
+        # ID 末尾是随机后缀，同一秒内的快照只能按创建时间排序
+        snapshots.sort(key=lambda s: s['created'])
+        return snapshots
+    
+    def delete(self, snapshot_id):
+        """删除快照，并回收不再被任何快照引用的对象"""
+        with self._lock:
+            self._ensure_dirs()
+            os.remove(self._manifest_path(snapshot_id))
+            
+            referenced = set()
+            for manifest in self._iter_manifests():
+                referenced.update(info['hash'] for info in manifest['files'].values())
+            
+            removed = 0
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                if not os.path.isdir(prefix_dir):
+                    continue
+                for digest in os.listdir(prefix_dir):
+                    if digest not in referenced:
+                        os.remove(os.path.join(prefix_dir, digest))
+                        removed += 1
+            
+            # 索引中的哈希可能指向已回收的对象，清理后由下次快照重新建立
+            self._index = {k: v for k, v in self._index.items() if v[4] in referenced}
+            self._save_index()
+        
+        return {'deleted': snapshot_id, 'objects_removed': removed}